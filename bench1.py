@@ -0,0 +1,187 @@
+#!/usr/bin/python3.4
+
+'''
+    Файл с замером производительности решения первой задачи.
+
+    Для каждого сочетания распределения точек, числа точек и
+    реализации структуры данных генерируется файл с точками,
+    после чего отдельно замеряется время разбора файла
+    (parse_file), построения структуры данных (fromPoints)
+    и вычисления ответов (allRadiiAndNeighbors).
+
+    Каждый замер выполняется в отдельном процессе, чтобы
+    пиковое потребление памяти относилось только к нему.
+    Результаты печатаются по одному объекту JSON на строке:
+        distribution, size, engine - параметры замера
+        parse_s, build_s, query_s  - время этапов в секундах
+        parse_rate, build_rate,
+        query_rate                 - точек в секунду на этапе
+        peak_rss_mb                - пиковый объём памяти процесса
+                                     (или его процессов-обработчиков)
+        depth                      - глубина дерева (null для grid)
+'''
+
+import os, sys, json, math, time, random, resource, tempfile, argparse, multiprocessing
+import task1
+
+def uniform(n, rnd):
+    # Равномерно распределённые точки в квадрате
+    return [(rnd.uniform(0, 1000), rnd.uniform(0, 1000)) for _ in range(n)]
+
+def clustered(n, rnd):
+    # Нормально распределённые скопления точек вокруг случайных центров
+    centers = [(rnd.uniform(0, 1000), rnd.uniform(0, 1000))
+               for _ in range(max(1, int(math.sqrt(n)) // 10))]
+    points = []
+    for _ in range(n):
+        x, y = rnd.choice(centers)
+        points.append((rnd.gauss(x, 5), rnd.gauss(y, 5)))
+    return points
+
+def lattice(n, rnd):
+    # Узлы целочисленной решётки: много равных расстояний
+    side = int(math.ceil(math.sqrt(n)))
+    return [(float(i // side), float(i % side)) for i in range(n)]
+
+def collinear(n, rnd):
+    # Точки на одной прямой в случайном порядке
+    xs = rnd.sample(range(10*n), n)
+    return [(float(x), 2.0*x + 1.0) for x in xs]
+
+def sorted_uniform(n, rnd):
+    # Равномерно распределённые точки, упорядоченные по координатам
+    return sorted(uniform(n, rnd))
+
+# Распределения точек: имя - функция генерации (число точек, генератор)
+DISTRIBUTIONS = {
+    "uniform": uniform,
+    "clustered": clustered,
+    "lattice": lattice,
+    "collinear": collinear,
+    "sorted": sorted_uniform,
+}
+
+def generate_file(distribution, size, seed, directory):
+    '''
+        Сгенерировать файл с точками и вернуть путь к нему.
+        Аргументы:
+            distribution - имя распределения из DISTRIBUTIONS
+            size         - число точек
+            seed         - начальное значение генератора
+            directory    - каталог для файла
+    '''
+    rnd = random.Random("{}-{}-{}".format(distribution, size, seed))
+    # Убираем совпадающие точки, сохраняя порядок
+    points = list(dict.fromkeys(DISTRIBUTIONS[distribution](size, rnd)))
+    path = os.path.join(directory, "{}-{}.txt".format(distribution, size))
+    with open(path, "w") as f:
+        for start in range(0, len(points), 1 << 16):
+            f.write("".join("{!r} {!r}\n".format(*point)
+                            for point in points[start:start + (1 << 16)]))
+    return path
+
+def measure(path, engine, workers):
+    '''
+        Замерить этапы решения задачи для файла точек и вернуть
+        словарь с результатами. Аргументы:
+            path    - путь к файлу
+            engine  - имя реализации из task1.ENGINES
+            workers - число процессов для вычисления ответов
+    '''
+    start = time.perf_counter()
+    points = task1.parse_file(path)
+    parsed = time.perf_counter()
+    tree = task1.ENGINES[engine].fromPoints(points)
+    built = time.perf_counter()
+    task1.parallel_answers(tree, workers)
+    done = time.perf_counter()
+    result = {
+        "parse_s": parsed - start,
+        "build_s": built - parsed,
+        "query_s": done - built,
+        # С --workers ответы вычисляют дочерние процессы
+        "peak_rss_mb": max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024,
+        "depth": tree.depth() if hasattr(tree, "depth") else None,
+    }
+    for phase in ("parse", "build", "query"):
+        seconds = result[phase + "_s"]
+        result[phase + "_rate"] = len(points) / seconds if seconds > 0 else None
+    return result
+
+def _send_measure(connection, path, engine, workers):
+    '''
+        Выполнить measure и отправить результат через канал.
+        Аргументы:
+            connection       - передающий конец multiprocessing.Pipe
+            path, engine,
+            workers          - см. measure
+    '''
+    with connection:
+        connection.send(measure(path, engine, workers))
+
+def run_measure(context, path, engine, workers):
+    '''
+        Выполнить measure в новом процессе и вернуть результат
+        либо None, если процесс завершился с ошибкой. Процесс
+        не является демоном (в отличие от процессов Pool), поэтому
+        может сам запускать процессы для --workers. Аргументы:
+            context       - контекст multiprocessing
+            path, engine,
+            workers       - см. measure
+    '''
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_send_measure, args=(sender, path, engine, workers))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    finally:
+        receiver.close()
+        process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--distributions", help="point distributions (default: all)",
+        nargs="+", choices=sorted(DISTRIBUTIONS), default=sorted(DISTRIBUTIONS))
+    parser.add_argument("--sizes", help="numbers of points (default: 1000 10000 100000)",
+        nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--engines", help="data structures to measure (default: array)",
+        nargs="+", choices=sorted(task1.ENGINES), default=["array"])
+    parser.add_argument("--workers", help="number of worker processes (default: 1)",
+        type=int, default=1)
+    parser.add_argument("--seed", help="random seed (default: 0)", type=int, default=0)
+    parser.add_argument("--output", help="file to append results to "
+        "(default: standard output)", type=str, default=None)
+    args = parser.parse_args()
+    if "grid" in args.engines and task1.np is None:
+        return print("Error: the grid engine requires NumPy")
+    out = open(args.output, "a") if args.output else sys.stdout
+    # Каждый замер - в новом процессе, чтобы пиковая память не
+    # включала память предыдущих замеров
+    context = multiprocessing.get_context("spawn")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for distribution in args.distributions:
+                for size in args.sizes:
+                    path = generate_file(distribution, size, args.seed, directory)
+                    for engine in args.engines:
+                        result = run_measure(context, path, engine, args.workers)
+                        if result is None:
+                            return print("Error: measurement failed for {} {} {}".format(
+                                distribution, size, engine))
+                        record = {"distribution": distribution, "size": size,
+                                  "engine": engine, "workers": args.workers}
+                        record.update(result)
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+                    os.remove(path)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+'''
+    Сервер, отвечающий на запросы о радиусе и числе
+    соседей точек из набора первой задачи.
+
+    Набор точек загружается один раз при запуске, после
+    чего клиенты задают вопросы по TCP или Unix-сокету,
+    не тратя время на запуск интерпретатора, разбор файла
+    и построение дерева.
+
+    ПРОТОКОЛ:
+    Клиент отправляет команды по одной на строке, сервер
+    отвечает на каждую одной строкой в том же порядке:
+        QUERY x y   - "OK радиус число_соседей" для точки набора
+        INSERT x y  - добавить точку, ответ "OK"
+        REMOVE x y  - удалить точку, ответ "OK"
+        SIZE        - "OK число_точек"
+        RELOAD file - загрузить набор точек из файла,
+                      ответ "OK число_точек"
+    При ошибке сервер отвечает строкой "ERROR сообщение"
+    и продолжает работу.
+
+    Команды всех клиентов, поступившие за время обработки
+    предыдущей порции, обрабатываются одной порцией, а ответы
+    каждому клиенту отправляются одной записью. Команды, которые
+    изменяют дерево (INSERT, REMOVE, RELOAD), выполняются в
+    отдельном потоке, чтобы не останавливать обмен с клиентами;
+    команды по-прежнему выполняются строго по очереди.
+
+    Требуется Python 3.7 или новее (asyncio.run).
+'''
+
+import math, asyncio, argparse
+from task1 import IncrementalKdTree, parse_file
+
+class QueryServer:
+    '''
+        Класс, обслуживающий клиентов. Точки хранятся в
+        IncrementalKdTree, поэтому ответ на запрос - это поиск
+        в словаре, а вставка и удаление точки пересчитывают
+        ответы только затронутых ею точек.
+    '''
+
+    # Команды, которые выполняются вне цикла событий
+    UPDATES = (b"INSERT", b"REMOVE", b"RELOAD")
+
+    def __init__(self, tree):
+        '''
+            tree - объект IncrementalKdTree с набором точек
+        '''
+        self.tree = tree
+        self.pending = None # очередь пар (команда, future для ответа)
+
+    async def serve(self, host=None, port=None, path=None):
+        '''
+            Запустить сервер и обслуживать клиентов до остановки.
+            Аргументы:
+                host, port - адрес TCP-сокета
+                path       - путь к Unix-сокету (вместо TCP)
+        '''
+        self.pending = asyncio.Queue()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handleClient, path)
+        else:
+            server = await asyncio.start_server(self.handleClient, host, port)
+        worker = asyncio.ensure_future(self.processBatches())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+
+    async def handleClient(self, reader, writer):
+        '''
+            Читать команды клиента и ставить их в общую очередь.
+            Ответы отправляет отдельная сопрограмма в порядке
+            поступления команд, так что клиент может отправлять
+            команды, не дожидаясь ответов.
+        '''
+        responses = asyncio.Queue()
+        sender = asyncio.ensure_future(self._sendResponses(responses, writer))
+        try:
+            while not writer.is_closing():
+                line = await reader.readline()
+                if not line:
+                    break
+                future = asyncio.get_running_loop().create_future()
+                self.pending.put_nowait((line, future))
+                responses.put_nowait(future)
+        except ConnectionError:
+            pass
+        finally:
+            responses.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def _sendResponses(self, responses, writer):
+        '''
+            Отправлять клиенту ответы по мере их готовности.
+            Готовые подряд ответы отправляются одной записью.
+            Если клиент отключился, оставшиеся команды отменяются.
+            Аргументы:
+                responses - очередь future ответов, None - конец
+        '''
+        try:
+            while True:
+                future = await responses.get()
+                if future is None:
+                    break
+                response = await future
+                if writer.is_closing():
+                    break
+                writer.write(response)
+                if responses.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Ответы больше некому отправлять: отменённые команды
+            # пропускаются при обработке порций
+            while not responses.empty():
+                future = responses.get_nowait()
+                if future is not None:
+                    future.cancel()
+
+    async def processBatches(self):
+        '''
+            Выполнять команды порциями: всё, что накопилось
+            в очереди, пока выполнялась предыдущая порция.
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            while not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            # Подряд идущие изменения дерева выполняются одним вызовом
+            # в потоке; дерево меняет только этот поток, а остальные
+            # команды выполняются после его завершения, поэтому
+            # одновременного доступа к дереву нет
+            updates = []
+            for line, future in batch + [(None, None)]:
+                if line is not None and self._isUpdate(line):
+                    updates.append((line, future))
+                    continue
+                if updates:
+                    results = await loop.run_in_executor(None, self.executeAll,
+                        [line for line, future in updates])
+                    for (_, pending), result in zip(updates, results):
+                        if not pending.cancelled():
+                            pending.set_result(result)
+                    updates = []
+                if line is not None and not future.cancelled():
+                    future.set_result(self.execute(line))
+
+    def _isUpdate(self, line):
+        '''
+            Вернуть True, если команда изменяет дерево.
+            Аргументы:
+                line - строка команды (bytes)
+        '''
+        words = line.split(None, 1)
+        return bool(words) and words[0].upper() in self.UPDATES
+
+    def executeAll(self, lines):
+        '''
+            Выполнить команды по порядку и вернуть список строк
+            ответов. Аргументы:
+                lines - список строк команд (bytes)
+        '''
+        return [self.execute(line) for line in lines]
+
+    def execute(self, line):
+        '''
+            Выполнить одну команду и вернуть строку ответа.
+            Аргументы:
+                line - строка команды (bytes)
+        '''
+        words = line.decode(errors="replace").split()
+        if not words:
+            return b"ERROR empty command\n"
+        command, args = words[0].upper(), words[1:]
+        try:
+            if command in ("QUERY", "INSERT", "REMOVE"):
+                if len(args) != 2:
+                    raise ValueError("expected 2 coordinates")
+                point = (float(args[0]), float(args[1]))
+                if not all(map(math.isfinite, point)):
+                    raise ValueError("coordinates must be finite")
+                if command == "QUERY":
+                    return "OK {} {}\n".format(*self.tree.getRadiusAndNeighbors(point)).encode()
+                if command == "INSERT":
+                    self.tree.addPoint(point)
+                else:
+                    self.tree.removePoint(point)
+                return b"OK\n"
+            if command == "SIZE":
+                return "OK {}\n".format(len(self.tree.answers)).encode()
+            if command == "RELOAD":
+                if len(args) != 1:
+                    raise ValueError("expected file name")
+                points = parse_file(args[0])
+                if not points:
+                    raise ValueError("cannot load points from {}".format(args[0]))
+                # Новое дерево подменяет старое, только когда построено
+                self.tree = IncrementalKdTree.fromPoints(points)
+                return "OK {}\n".format(len(points)).encode()
+        except (ValueError, OSError) as e:
+            return "ERROR {}\n".format(e).encode()
+        except Exception as e:
+            # Сбой одной команды не должен останавливать обработку
+            # остальных команд и других клиентов
+            return "ERROR internal error: {!r}\n".format(e).encode()
+        return "ERROR unknown command {}\n".format(command).encode()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="file with list of points", type=str)
+    parser.add_argument("--host", help="address to listen on (default: 127.0.0.1)",
+        type=str, default="127.0.0.1")
+    parser.add_argument("--port", help="TCP port to listen on (default: 8765)",
+        type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP",
+        type=str, default=None)
+    args = parser.parse_args()
+    points = parse_file(args.file)
+    if not points:
+        return
+    server = QueryServer(IncrementalKdTree.fromPoints(points))
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
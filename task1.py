@@ -12,127 +12,1045 @@
     и количество соседей.
 
     ФОРМАТ ВХОДНЫХ ДАННЫХ:
-    Первый и единственный аргумент программы - путь к файлу,
-    в котором лежит список точек.
+    Первый аргумент программы - путь к файлу, в котором
+    лежит список точек.
     Формат файла: координаты точки должны быть указаны
     через пробел, каждая точка на отдельной строке.
+    Также поддерживаются двоичные форматы: пары чисел float64
+    подряд (.f64, .bin) и массивы NumPy формы (N,2) (.npy).
+    Формат определяется по расширению либо аргументом --format.
+    Точки могут иметь любое число координат d (d столбцов в
+    текстовом файле, массив формы (N,d) в .npy); для d != 2
+    поддерживается только --engine tree.
+    Необязательные аргументы --k и --multiplier обобщают задачу:
+    радиус - расстояние до k-й ближайшей точки, соседи - все
+    остальные точки в пределах радиуса, умноженного на multiplier
+    (по умолчанию k = 1, multiplier = 2; только для --engine tree).
+    Необязательный аргумент --epsilon включает приближённый режим
+    (только для --engine tree): радиусы не больше точных в
+    (1+epsilon) раз, а соседи могут учитываться в круге, большем
+    заданного не более чем в (1+epsilon) раз. Достигнутая
+    погрешность печатается в стандартный поток ошибок.
+    Необязательный аргумент --tile-size включает обработку по
+    плиткам для наборов точек, не помещающихся в память: файл
+    читается порциями, точки раскладываются по файлам плиток
+    (в каталоге --tile-dir), и каждая плитка обрабатывается
+    отдельно (только для --engine tree без --epsilon).
+    Необязательный аргумент --engine выбирает реализацию
+    структуры данных: tree (по умолчанию), array или grid.
+    Необязательный аргумент --workers задаёт число процессов,
+    между которыми распределяется вычисление ответов.
 
     ФОРМАТ ВЫХОДНЫХ ДАННЫХ:
     Для каждой точки в стандартный вывод печатается строка формата:
     (x, y): radius {float}, neighbors {int}
+    Аргумент --output-format выбирает другой формат вывода
+    (csv, jsonl, binary, npy), --output - файл вместо стандартного
+    вывода, --order input - вывод в порядке входного файла.
+    Аргументы --index, --cache и --cache-dir сохраняют построенное
+    дерево (только для --engine array) в файл индекса и открывают
+    его при следующих запусках с тем же входным файлом.
 
     Описание алгоритма решения приведено в README.
 '''
 
-import math, random, argparse
-from queue import Queue, PriorityQueue
+import os, sys, ast, json, math, mmap, time, random, struct, hashlib, tempfile, argparse, multiprocessing
+from array import array
+from heapq import heappush, heapreplace, merge
+from operator import itemgetter, eq
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError: # NumPy нужен только для реализации GridIndex
+    np = None
 
 class KdTree:
     '''
         Класс, реализующий структуру данных Kd-Tree.
+        Дерево поддерживает вставку и удаление точек. Баланс
+        поддерживается частичными перестроениями (как в scapegoat
+        tree): поддерево, в котором после вставки оказался слишком
+        глубокий узел, перестраивается по медианам.
     '''
 
-    def __init__(self):
+    ALPHA = 0.75 # допустимая доля узлов поддерева в одном потомке
+
+    def __init__(self, k=1, multiplier=2, epsilon=0):
+        '''
+            k          - номер соседа, расстояние до которого
+                         считается радиусом точки
+            multiplier - во сколько раз круг соседей больше
+                         радиуса (не меньше 1)
+            epsilon    - допустимая относительная погрешность
+                         ответов (0 - точные ответы). Найденный
+                         радиус не больше (1+epsilon) точного, а при
+                         подсчёте соседей учитываются все точки круга
+                         соседей и, возможно, часть точек круга в
+                         (1+epsilon) раз больше.
+        '''
         self.root = None # корневой узел дерева
+        self.maxSize = 0 # наибольшее число узлов после перестроения
+        self.k = k
+        self.multiplier = multiplier
+        self.epsilon = epsilon
+        # Достигнутая погрешность: во сколько раз найденные радиусы
+        # могут быть больше точных и во сколько раз круги, в которых
+        # подсчитаны соседи, могут быть больше заданных
+        self.radiusBound = 1.0
+        self.countBound = 1.0
+        # Наименьший квадрат расстояния до ветви, отсечённой
+        # приближённо при текущем поиске
+        self._pruned = math.inf
 
     def addPoint(self, point):
         '''
             Добавить точку в структуру данных. Аргументы:
                 point - кортеж координат (x,y)
         '''
+        if not all(map(math.isfinite, point)):
+            raise ValueError("Point coordinates must be finite")
         if self.root is None:
             self.root = Node(point)
+            self._rebuilt(self.root)
+            self.maxSize = 1
+            return
+        path = self._findPath(point)
+        if path[-1].point == point:
+            raise ValueError("Point already in tree")
+        for node in path:
+            node.size += 1 # точка попадёт в поддерево узла
+        path.append(path[-1].addLeaf(point))
+        self._rebuilt(path[-1])
+        self.maxSize = max(self.maxSize, self.root.size)
+        if len(path) - 1 > math.log(self.root.size, 1/self.ALPHA) + 2:
+            # Узел слишком глубоко: перестраиваем поддерево ближайшего
+            # к нему предка, у которого один потомок слишком велик
+            for level in range(len(path)-2, -1, -1):
+                if path[level+1].size > self.ALPHA * path[level].size:
+                    self._rebuild(path, level)
+                    break
+
+    def removePoint(self, point):
+        '''
+            Удалить точку из структуры данных. Поддерево узла точки
+            перестраивается из оставшихся в нём точек. Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        path = self._findPath(point) if self.root is not None else []
+        if not path or path[-1].point != point:
+            raise ValueError("Point not in tree")
+        for node in path:
+            node.size -= 1
+        self._rebuild(path, len(path)-1, exclude=point)
+        if self.root is not None and self.root.size < self.ALPHA * self.maxSize:
+            self._rebuild([self.root], 0)
+
+    @classmethod
+    def fromPoints(cls, points, k=1, multiplier=2, epsilon=0):
+        '''
+            Построить сбалансированное дерево по списку точек.
+            Каждый узел делит свои точки по медиане координаты
+            с наибольшим разбросом, поэтому глубина дерева
+            составляет O(log N) независимо от порядка точек во
+            входном списке. Аргументы:
+                points                 - список кортежей координат
+                k, multiplier, epsilon - см. KdTree.__init__
+        '''
+        tree = cls(k, multiplier, epsilon)
+        tree.root = _buildSubtree(points)
+        tree.maxSize = len(points)
+        if tree.root is not None:
+            tree._rebuilt(tree.root)
+        return tree
+
+    def depth(self):
+        '''
+            Вернуть глубину дерева: число узлов на самом длинном
+            пути от корня до листа.
+        '''
+        depth = 0
+        stack = [(self.root, 1)] if self.root is not None else []
+        while stack:
+            node, level = stack.pop()
+            depth = max(depth, level)
+            for child in (node.left, node.right):
+                if child is not None:
+                    stack.append((child, level+1))
+        return depth
+
+    def _findPath(self, point):
+        '''
+            Вернуть список узлов от корня до узла данной точки либо,
+            если точки нет в дереве, до узла, после которого она
+            должна быть вставлена. Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        path = [self.root]
+        while path[-1].point != point:
+            child = path[-1].next(point)
+            if child is None:
+                break
+            path.append(child)
+        return path
+
+    def _rebuild(self, path, level, exclude=None):
+        '''
+            Перестроить по медианам поддерево узла path[level]
+            и заменить его в дереве. Аргументы:
+                path    - список узлов от корня до узла поддерева
+                level   - номер перестраиваемого узла в списке
+                exclude - точка, которая не войдёт в новое поддерево
+        '''
+        old = path[level]
+        points = [point for point in _subtreePoints(old) if point != exclude]
+        new = _buildSubtree(points, old.rect)
+        if level == 0:
+            self.root = new
+            self.maxSize = len(points)
+        elif path[level-1].left is old:
+            path[level-1].left = new
         else:
-            self._findNode(point).addLeaf(point)
+            path[level-1].right = new
+        if new is not None:
+            self._rebuilt(new)
+
+    def _rebuilt(self, root):
+        '''
+            Вызывается после построения нового поддерева.
+            Подклассы хранят в узлах дополнительные данные
+            и пересчитывают их здесь. Аргументы:
+                root - корневой узел нового поддерева
+        '''
+        pass
 
     def getRadiusAndNeighbors(self, point):
         '''
-            Вернуть радиус и число соседей заданной точки.
+            Вернуть радиус и число соседей заданной точки. Если
+            в дереве не больше k точек, радиус бесконечен.
             Аргументы:
-                point - кортеж координат (x,y)
+                point - кортеж координат точки
         '''
-        node = self._findNode(point)
-        if node.point != point:
+        if self.root is None or self._findPath(point)[-1].point != point:
             raise ValueError("Point not in tree")
-        closest, radius = self._closestNeighbor(node.point)
-        all_points = self._rangeSearch(Rectangle.centeredIn(
-            point, 4*radius, 4*radius))
-        neighbors = [point for point in all_points
-            if radius <= node.distanceTo(point) <= 2*radius]
-        return radius, len(neighbors)
-
-    def _findNode(self, point):
-        '''
-            Если точка есть в дереве, найти её узел. Если точки
-            нет, найти родительский узел, после которого данная
-            точка должна быть вставлена. Аргументы:
-                point - кортеж координат (x,y)
+        self._pruned = math.inf
+        if self.k == 1:
+            closest, radius = self._closestNeighbor(point)
+        else:
+            radius = self._radiusFrom(self._nearestSquares(point, self.k))
+        if radius is None:
+            radius = math.inf
+        self._recordRadius(radius*radius)
+        # Соседи - это точки круга радиуса multiplier*радиус,
+        # кроме самой точки
+        return radius, self.countInCircle(point, self.multiplier*radius) - 1
+
+    def nearestNeighbors(self, point, k=None):
+        '''
+            Вернуть список k ближайших к данной точке точек дерева
+            (кроме самой точки) в виде пар (расстояние, точка) по
+            возрастанию расстояния. Аргументы:
+                point - кортеж координат точки
+                k     - число соседей (по умолчанию - self.k)
+        '''
+        heap = self._nearestSquares(point, k or self.k)
+        return [(math.sqrt(-square), other) for square, other in sorted(heap, reverse=True)]
+
+    def countInCircle(self, center, radius, start=None):
+        '''
+            Вернуть число точек дерева, лежащих в круге заданного
+            радиуса (включая границу). Поддеревья, прямоугольник
+            которых целиком лежит в круге, учитываются по числу
+            узлов без обхода, а не пересекающие круг - отсекаются.
+            Аргументы:
+                center - кортеж координат центра круга
+                radius - радиус круга
+                start  - корневой узел поддерева, в котором ведётся
+                         подсчёт (по умолчанию - всё дерево)
+            При epsilon > 0 поддеревья, прямоугольник которых лежит
+            в круге радиуса (1+epsilon)*radius, учитываются целиком.
         '''
+        count = 0
+        grow = 1 + self.epsilon
+        planar = len(center) == 2
+        if planar:
+            x, y = center
+        stack = [start or self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if not planar:
+                rect = node.rect
+                if rect.distanceTo(center) > radius:
+                    continue
+                far = rect.farthestDistanceTo(center)
+                if far <= radius*grow:
+                    if far > radius:
+                        self.countBound = max(self.countBound, far/radius)
+                    count += node.size
+                    continue
+                if node.distanceTo(center) <= radius:
+                    count += 1
+            else:
+                # На плоскости проверки те же, но без вызовов методов
+                (x1, x2), (y1, y2) = node.rect.coords
+                # Расстояния по каждой координате до ближайшей (dx, dy)
+                # и до самой дальней (fx, fy) точек прямоугольника
+                if x1 is not None and x < x1:
+                    dx = x1 - x
+                elif x2 is not None and x > x2:
+                    dx = x - x2
+                else:
+                    dx = 0.0
+                if y1 is not None and y < y1:
+                    dy = y1 - y
+                elif y2 is not None and y > y2:
+                    dy = y - y2
+                else:
+                    dy = 0.0
+                if math.sqrt(dx*dx + dy*dy) > radius:
+                    continue
+                if x1 is not None and x2 is not None and y1 is not None and y2 is not None:
+                    fx = max(x - x1, x2 - x)
+                    fy = max(y - y1, y2 - y)
+                    far = math.sqrt(fx*fx + fy*fy)
+                    if far <= radius*grow:
+                        if far > radius:
+                            self.countBound = max(self.countBound, far/radius)
+                        count += node.size
+                        continue
+                dx = node.point[0] - x
+                dy = node.point[1] - y
+                if math.sqrt(dx*dx + dy*dy) <= radius:
+                    count += 1
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        return count
+
+    def allRadiiAndNeighbors(self, part=0, parts=1):
+        '''
+            Вернуть словарь, в котором ключи - все точки дерева,
+            а значения - кортежи (радиус, число_соседей).
+            Дерево обходится в глубину один раз. Поиск для каждого
+            узла начинается с его собственного поддерева и поднимается
+            к предкам только до тех пор, пока круг поиска выходит за
+            прямоугольник текущего поддерева, поэтому соседние по
+            дереву запросы не повторяют спуск от корня.
+            Работу можно разбить на независимые части (например, для
+            разных процессов): поддеревья глубины _splitDepth(parts)
+            распределяются между частями по очереди, а узлы выше
+            них относятся к части 0. Аргументы:
+                part  - номер вычисляемой части
+                parts - число частей
+        '''
+        result = {}
         if self.root is None:
-            raise ValueError("No nodes to search")
-        node = self.root
-        while node.next(point) is not None:
-            if node.point == point:
-                return node
-            node = node.next(point)
-        return node
+            return result
+        split = _splitDepth(parts)
+        subtrees = 0 # число пройденных поддеревьев глубины split
+        path = [] # путь от корня до текущего узла
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == split:
+                subtrees += 1
+                if subtrees % parts != part:
+                    continue
+            del path[depth:]
+            path.append(node)
+            if depth >= split or part == 0:
+                result[node.point] = self._radiusAndNeighborsFrom(path)
+            for child in (node.right, node.left):
+                if child is not None:
+                    stack.append((child, depth+1))
+        return result
+
+    def _radiusAndNeighborsFrom(self, path):
+        '''
+            Вернуть радиус и число соседей точки последнего узла
+            пути, начиная поиск с поддерева этого узла. Аргументы:
+                path - список узлов от корня до данного узла
+        '''
+        point = path[-1].point
+        self._pruned = math.inf
+        if self.k == 1:
+            closest, best = self._closestSquare(point, path[-1])
+        else:
+            heap = self._nearestSquares(point, self.k, path[-1])
+            best = -heap[0][0] if len(heap) == self.k else None
+        grow = 1 + self.epsilon
+        level = len(path)-1
+        # Подъём прекращается, когда прямоугольник поддерева содержит
+        # круг найденного радиуса (при epsilon > 0 - уменьшенного в
+        # (1+epsilon) раз): точки вне поддерева не ближе этого круга
+        while level > 0 and (best is None or
+                not path[level].rect.containsCircle(point, math.sqrt(best)/grow)):
+            parent = path[level-1]
+            sibling = parent.left if parent.right is path[level] else parent.right
+            if self.k == 1:
+                dist = _squareDistance(parent.point, point)
+                if best is None or dist < best:
+                    best = dist
+                if sibling is not None:
+                    closest, best = self._closestSquare(point, sibling, best)
+            else:
+                _offerSquare(heap, self.k, _squareDistance(parent.point, point), parent.point)
+                if sibling is not None:
+                    self._nearestSquares(point, self.k, sibling, heap)
+                best = -heap[0][0] if len(heap) == self.k else None
+            level -= 1
+        if best is not None and level > 0 and grow > 1 and \
+                not path[level].rect.containsCircle(point, math.sqrt(best)):
+            self._pruned = min(self._pruned, best/(grow*grow))
+        self._recordRadius(best if best is not None else math.inf)
+        radius = math.sqrt(best) if best is not None else math.inf
+        # Все точки в пределах круга соседей лежат в поддереве
+        # ближайшего предка, прямоугольник которого содержит круг
+        bound = self.multiplier*radius
+        level = len(path)-1
+        while level > 0 and not path[level].rect.containsCircle(point, bound):
+            level -= 1
+        return radius, self.countInCircle(point, bound, path[level]) - 1
 
     def _closestNeighbor(self, point):
         '''
             Найти ближайщего соседа данной точки. Если
             узел с координатами этой точки есть в дереве,
-            при поиске соседа он игнорируется. Аргументы:
-                point - кортеж координат (x,y)
+            при поиске соседа он игнорируется. Вернуть
+            кортеж (узел, расстояние). Аргументы:
+                point - кортеж координат точки
         '''
-        
-        min_distance = None
+        min_node, min_square = self._closestSquare(point)
+        if min_node is None:
+            return None, None
+        return min_node, math.sqrt(min_square)
+
+    def _closestSquare(self, point, start=None, best=None):
+        '''
+            Найти ближайшего соседа данной точки в поддереве среди
+            точек, квадрат расстояния до которых меньше best. Вернуть
+            кортеж (узел, квадрат расстояния); если такой точки нет -
+            (None, best). Поиск ведётся в глубину: сначала обходится
+            потомок, в половине которого лежит точка, а ветви, которые
+            заведомо дальше найденной точки, отсекаются. Расстояния
+            сравниваются в квадрате, без извлечения корня. Аргументы:
+                point - кортеж координат точки
+                start - корневой узел поддерева (по умолчанию - корень)
+                best  - уже найденный квадрат расстояния или None
+            При epsilon > 0 отсекаются и ветви, которые не могут
+            уменьшить расстояние более чем в (1+epsilon) раз.
+        '''
+        shrink = (1 + self.epsilon)**2
+        planar = len(point) == 2
+        if planar:
+            x, y = point
         min_node = None
+        stack = [start or self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if not planar:
+                if best is not None:
+                    near = node.rect.squareDistanceTo(point)
+                    if near*shrink > best:
+                        if near <= best:
+                            self._pruned = min(self._pruned, near)
+                        continue
+                dist = _squareDistance(node.point, point)
+            else:
+                if best is not None:
+                    # Условие отсечения ветви поиска: все потомки узла
+                    # заведомо дальше уже найденной точки
+                    (x1, x2), (y1, y2) = node.rect.coords
+                    if x1 is not None and x < x1:
+                        dx = x1 - x
+                    elif x2 is not None and x > x2:
+                        dx = x - x2
+                    else:
+                        dx = 0.0
+                    if y1 is not None and y < y1:
+                        dy = y1 - y
+                    elif y2 is not None and y > y2:
+                        dy = y - y2
+                    else:
+                        dy = 0.0
+                    near = dx*dx + dy*dy
+                    if near*shrink > best:
+                        if near <= best:
+                            self._pruned = min(self._pruned, near)
+                        continue
+                dx = node.point[0] - x
+                dy = node.point[1] - y
+                dist = dx*dx + dy*dy
+            if dist > 0 and (best is None or dist < best):
+                best = dist
+                min_node = node
+            # Ближний к точке потомок кладётся в стек последним,
+            # чтобы быть обойдённым первым
+            if point[node.coord] < node.point[node.coord]:
+                near, far = node.left, node.right
+            else:
+                near, far = node.right, node.left
+            if far is not None:
+                stack.append(far)
+            if near is not None:
+                stack.append(near)
+        return min_node, best
 
-        # Формируем приоритетную очередь по принципу
-        # "чем ближе прямоугольник узла к данной
-        # точке - тем лучше".
-        queue = PriorityQueue()
-        queue.put((0, self.root)) # начинаем обход с корневого узла
+    def _nearestSquares(self, point, k, start=None, heap=None):
+        '''
+            Найти k ближайших к данной точке точек поддерева (кроме
+            самой точки). Вернуть кучу heap, дополненную найденными
+            точками: список не более чем из k пар (-квадрат
+            расстояния, точка), упорядоченный как куча heapq, так что
+            в heap[0] лежит самая дальняя из найденных точек. Обход
+            такой же, как в _closestSquare: ветви, заведомо более
+            далёкие, чем k-я найденная точка, отсекаются. Аргументы:
+                point - кортеж координат точки
+                k     - число соседей
+                start - корневой узел поддерева (по умолчанию - корень)
+                heap  - куча уже найденных точек или None
+        '''
+        if heap is None:
+            heap = []
+        shrink = (1 + self.epsilon)**2
+        planar = len(point) == 2
+        if planar:
+            x, y = point
+        stack = [start or self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            full = len(heap) == k
+            if not planar:
+                if full:
+                    near = node.rect.squareDistanceTo(point)
+                    if near*shrink > -heap[0][0]:
+                        if near <= -heap[0][0]:
+                            self._pruned = min(self._pruned, near)
+                        continue
+                dist = _squareDistance(node.point, point)
+            else:
+                if full:
+                    (x1, x2), (y1, y2) = node.rect.coords
+                    if x1 is not None and x < x1:
+                        dx = x1 - x
+                    elif x2 is not None and x > x2:
+                        dx = x - x2
+                    else:
+                        dx = 0.0
+                    if y1 is not None and y < y1:
+                        dy = y1 - y
+                    elif y2 is not None and y > y2:
+                        dy = y - y2
+                    else:
+                        dy = 0.0
+                    near = dx*dx + dy*dy
+                    if near*shrink > -heap[0][0]:
+                        if near <= -heap[0][0]:
+                            self._pruned = min(self._pruned, near)
+                        continue
+                dx = node.point[0] - x
+                dy = node.point[1] - y
+                dist = dx*dx + dy*dy
+            if dist > 0:
+                _offerSquare(heap, k, dist, node.point)
+            if point[node.coord] < node.point[node.coord]:
+                near, far = node.left, node.right
+            else:
+                near, far = node.right, node.left
+            if far is not None:
+                stack.append(far)
+            if near is not None:
+                stack.append(near)
+        return heap
 
-        while not queue.empty():
-            dist_to_rect, node = queue.get()
+    def _radiusFrom(self, heap):
+        '''
+            Вернуть радиус точки (расстояние до k-й ближайшей точки)
+            по куче _nearestSquares либо None, если в куче меньше k
+            точек. Аргументы:
+                heap - куча пар (-квадрат расстояния, точка)
+        '''
+        if len(heap) < self.k:
+            return None
+        return math.sqrt(-heap[0][0])
 
-            dist_to_point = node.distanceTo(point)
-            if dist_to_point > 0 and (min_distance is None or dist_to_point < min_distance):
-                min_distance = dist_to_point
-                min_node = node
-            elif min_distance is not None and dist_to_rect > min_distance:
-                # Условие отсечения ветви поиска: если
-                # все потомки данного узла заведомо
-                # дальше от исходой точки, чем уже
-                # найденный ближайший узел
-                continue
+    def _recordRadius(self, best):
+        '''
+            Учесть погрешность радиуса, найденного последним поиском.
+            Ни одна отсечённая приближённо ветвь не ближе sqrt(_pruned),
+            поэтому точный радиус не меньше min(найденный, sqrt(_pruned)).
+            Аргументы:
+                best - квадрат найденного радиуса
+        '''
+        if self._pruned < best < math.inf:
+            self.radiusBound = max(self.radiusBound, math.sqrt(best/self._pruned))
 
-            for child in (node.left, node.right):
-                if child is None:
-                    continue
-                queue.put((child.rect.distanceTo(point), child))
-        return min_node, min_distance
+    def _resetCounters(self):
+        '''
+            Сбросить достигнутую погрешность (и другие счётчики
+            подклассов) перед вычислением части ответов.
+        '''
+        self.radiusBound = self.countBound = 1.0
 
-    def _rangeSearch(self, rect):
+    def _counters(self):
         '''
-            Поиск всех точек, лежащих в прямоугольном диапазоне.
+            Вернуть достигнутую погрешность (и другие счётчики
+            подклассов) для передачи из процесса-обработчика.
+        '''
+        return self.radiusBound, self.countBound
+
+    def _mergeCounters(self, counters):
+        '''
+            Учесть счётчики, полученные из процесса-обработчика.
             Аргументы:
-                rect - объект Rectangle
+                counters - результат _counters()
+        '''
+        self.radiusBound = max(self.radiusBound, counters[0])
+        self.countBound = max(self.countBound, counters[1])
+
+class IncrementalKdTree(KdTree):
+    '''
+        Kd-Tree, которое хранит ответы (радиус, число соседей)
+        для всех своих точек в словаре answers и при вставке или
+        удалении точки обновляет ответы только тех точек, на
+        которые она влияет: точка B влияет на A, если лежит
+        в пределах круга соседей A (радиус A, умноженный на
+        multiplier). Чтобы быстро находить такие точки, каждый
+        узел хранит в поле reach наибольший радиус круга соседей
+        точек своего поддерева. Если в дереве не больше k точек,
+        их радиус бесконечен. Ответы всегда точные: обновление
+        ответов полагается на точные радиусы.
+    '''
+
+    def __init__(self, k=1, multiplier=2, epsilon=0):
+        if epsilon:
+            raise ValueError("IncrementalKdTree requires exact answers")
+        super().__init__(k, multiplier)
+        self.answers = {} # {точка: (радиус, число_соседей)}
+
+    @classmethod
+    def fromPoints(cls, points, k=1, multiplier=2):
+        '''
+            Построить дерево по списку точек и вычислить ответы
+            для всех точек. Аргументы:
+                points        - список кортежей координат
+                k, multiplier - см. KdTree.__init__
+        '''
+        tree = super().fromPoints(points, k, multiplier)
+        tree.answers = KdTree.allRadiiAndNeighbors(tree)
+        if tree.root is not None:
+            tree._rebuilt(tree.root)
+        return tree
+
+    def addPoint(self, point):
+        '''
+            Добавить точку и обновить ответы точек, на которые
+            она влияет. Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        if point in self.answers:
+            raise ValueError("Point already in tree")
+        self.answers[point] = (0.0, 0) # пока ответ не вычислен
+        try:
+            super().addPoint(point)
+        except BaseException:
+            del self.answers[point]
+            raise
+        changed = {} # прежние ответы точек, изменённые вставкой
+        try:
+            self.answers[point] = self._answerFor(point)
+            visited, affected = self._affectedBy(point)
+            for node, dist in affected:
+                radius, neighbors = changed[node.point] = self.answers[node.point]
+                if dist < radius and self.k == 1:
+                    # Новая точка стала ближайшей
+                    self.answers[node.point] = (dist, self.countInCircle(
+                        node.point, self.multiplier*dist) - 1)
+                elif dist < radius:
+                    # Новая точка оказалась ближе k-й: радиус уменьшился
+                    self.answers[node.point] = self._answerFor(node.point)
+                else:
+                    self.answers[node.point] = (radius, neighbors + 1)
+            self._updateReach(visited)
+        except BaseException:
+            self._undoAdd(point, changed)
+            raise
+
+    def _undoAdd(self, point, changed):
+        '''
+            Отменить вставку точки после ошибки: вернуть прежние
+            ответы, удалить узел точки и пересчитать поле reach на
+            путях к точкам, ответы которых менялись. Аргументы:
+                point   - добавленная точка
+                changed - словарь прежних ответов {точка: ответ}
+        '''
+        self.answers.update(changed)
+        del self.answers[point]
+        KdTree.removePoint(self, point)
+        if self.root is None:
+            return
+        # Предки идут раньше потомков: узлы упорядочены по глубине
+        nodes = {}
+        for other in [point] + list(changed):
+            for depth, node in enumerate(self._findPath(other)):
+                nodes[id(node)] = (depth, node)
+        self._updateReach([node for depth, node in sorted(nodes.values(), key=itemgetter(0))])
+
+    def removePoint(self, point):
+        '''
+            Удалить точку и обновить ответы точек, на которые
+            она влияла. Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        super().removePoint(point)
+        del self.answers[point]
+        if self.root is None:
+            return
+        visited, affected = self._affectedBy(point)
+        for node, dist in affected:
+            radius, neighbors = self.answers[node.point]
+            if dist <= radius:
+                # Удалена одна из k ближайших точек: радиус мог увеличиться
+                self.answers[node.point] = self._answerFor(node.point)
+            else:
+                self.answers[node.point] = (radius, neighbors - 1)
+        self._updateReach(visited)
+
+    def getRadiusAndNeighbors(self, point):
+        '''
+            Вернуть сохранённые радиус и число соседей точки.
+            Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        if point not in self.answers:
+            raise ValueError("Point not in tree")
+        return self.answers[point]
+
+    def allRadiiAndNeighbors(self, part=0, parts=1):
+        '''
+            Вернуть словарь сохранённых ответов для всех точек
+            (либо для части номер part из parts, см. KdTree).
+        '''
+        if parts == 1:
+            return dict(self.answers)
+        return {point: self.answers[point] for point
+                in KdTree.allRadiiAndNeighbors(self, part, parts)}
+
+    def _answerFor(self, point):
+        '''
+            Вычислить радиус и число соседей точки дерева.
+            Аргументы:
+                point - кортеж координат точки
+        '''
+        return KdTree.getRadiusAndNeighbors(self, point)
+
+    def _affectedBy(self, point):
+        '''
+            Найти точки дерева, от которых данная точка лежит в
+            пределах их круга соседей. Вернуть кортеж (список
+            посещённых узлов в прямом порядке обхода, список пар
+            (узел, расстояние до точки)). Поддеревья, все точки
+            которых дальше своего круга соседей, отсекаются по
+            полю reach. Аргументы:
+                point - кортеж координат точки
+        '''
+        visited, affected = [], []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.rect.distanceTo(point) > node.reach:
+                continue
+            visited.append(node)
+            dist = node.distanceTo(point)
+            if node.point != point and dist <= self.multiplier*self.answers[node.point][0]:
+                affected.append((node, dist))
+            for child in (node.left, node.right):
+                if child is not None:
+                    stack.append(child)
+        return visited, affected
+
+    def _updateReach(self, nodes):
+        '''
+            Пересчитать поле reach узлов. Потомки каждого узла
+            должны идти в списке позже него. Аргументы:
+                nodes - список узлов
         '''
-        queue = Queue() # очередь узлов, в потомках которых
-                        # потенциально есть искомые точки
-        queue.put(self.root)
-        result = [] # список найденных точек
-        while not queue.empty():
-            node = queue.get()
-            if rect.hasInside(node.point):
-                result.append(node.point)
+        for node in reversed(nodes):
+            node.reach = self.multiplier*self.answers[node.point][0]
             for child in (node.left, node.right):
-                if child is not None and child.rect.intersectsWith(rect):
-                    queue.put(child)
+                if child is not None and child.reach > node.reach:
+                    node.reach = child.reach
+
+    def _rebuilt(self, root):
+        # Пока ответы не вычислены (при построении), reach не нужен
+        if self.answers:
+            self._updateReach(_subtreeNodes(root))
+
+class SearchStats:
+    '''
+        Счётчики работы поисковых операций дерева. Для каждого
+        вида поиска (closest - ближайший сосед, nearest - k
+        ближайших соседей, count - подсчёт точек в круге) хранятся
+        суммы по всем запросам:
+            queries    - число запросов (ответ для одной точки - один
+                         запрос, включая поиски при подъёме к предкам)
+            visited    - число узлов, снятых со стека
+            pruned     - число отсечённых узлов
+            stackOps   - число операций со стеком (добавлений и снятий)
+            candidates - число точек, расстояние до которых проверено
+            whole      - число поддеревьев, учтённых целиком (count)
+        и гистограмма числа посещённых узлов на запрос по степеням
+        двойки: ключ k - запросы, посетившие от 2^(k-1) до 2^k-1 узлов.
+    '''
+
+    FIELDS = ("queries", "visited", "pruned", "stackOps", "candidates", "whole")
+
+    def __init__(self):
+        self.totals = {} # {вид поиска: {счётчик: значение}}
+        self.histograms = {} # {вид поиска: {k: число запросов}}
+
+    def record(self, kind, visited, pruned, stackOps, candidates, whole=0):
+        '''
+            Учесть один запрос. Аргументы:
+                kind - вид поиска
+                visited, pruned, stackOps, candidates, whole -
+                       значения счётчиков запроса
+        '''
+        totals = self.totals.get(kind)
+        if totals is None:
+            totals = self.totals[kind] = dict.fromkeys(self.FIELDS, 0)
+            self.histograms[kind] = {}
+        totals["queries"] += 1
+        totals["visited"] += visited
+        totals["pruned"] += pruned
+        totals["stackOps"] += stackOps
+        totals["candidates"] += candidates
+        totals["whole"] += whole
+        bucket = visited.bit_length()
+        self.histograms[kind][bucket] = self.histograms[kind].get(bucket, 0) + 1
+
+    def merge(self, other):
+        '''
+            Прибавить счётчики другого объекта SearchStats
+            (например, собранные в процессе-обработчике).
+        '''
+        for kind, totals in other.totals.items():
+            mine = self.totals.setdefault(kind, dict.fromkeys(self.FIELDS, 0))
+            histogram = self.histograms.setdefault(kind, {})
+            for field, value in totals.items():
+                mine[field] += value
+            for bucket, value in other.histograms[kind].items():
+                histogram[bucket] = histogram.get(bucket, 0) + value
+
+    def summary(self):
+        '''
+            Вернуть словарь со счётчиками, средним числом
+            посещённых узлов на запрос и гистограммой, пригодный
+            для сохранения в JSON.
+        '''
+        result = {}
+        for kind in sorted(self.totals):
+            totals = dict(self.totals[kind])
+            totals["visitedPerQuery"] = totals["visited"] / totals["queries"]
+            totals["histogram"] = {"{}-{}".format(1 << bucket >> 1, (1 << bucket) - 1): count
+                                   for bucket, count in sorted(self.histograms[kind].items())}
+            result[kind] = totals
         return result
 
+class ProfiledKdTree(KdTree):
+    '''
+        KdTree, собирающее в поле stats (объект SearchStats)
+        счётчики поисковых операций. Поиск выполняется так же,
+        как в KdTree (но без отдельной ветви для плоскости);
+        счётчики ведутся только в этом классе, поэтому KdTree
+        не тратит на них время.
+    '''
+
+    def __init__(self, k=1, multiplier=2, epsilon=0):
+        super().__init__(k, multiplier, epsilon)
+        self.stats = SearchStats()
+        self._query = None # счётчики поисков для ответа текущей точки
+
+    def _resetCounters(self):
+        super()._resetCounters()
+        self.stats = SearchStats()
+
+    def _counters(self):
+        return super()._counters(), self.stats
+
+    def _mergeCounters(self, counters):
+        super()._mergeCounters(counters[0])
+        self.stats.merge(counters[1])
+
+    def countInCircle(self, center, radius, start=None):
+        '''
+            То же, что KdTree.countInCircle, со сбором счётчиков.
+        '''
+        count = visited = pruned = candidates = whole = 0
+        grow = 1 + self.epsilon
+        stack = [start or self.root] if self.root is not None else []
+        pushes = len(stack)
+        while stack:
+            node = stack.pop()
+            visited += 1
+            if node.rect.distanceTo(center) > radius:
+                pruned += 1
+                continue
+            far = node.rect.farthestDistanceTo(center)
+            if far <= radius*grow:
+                if far > radius:
+                    self.countBound = max(self.countBound, far/radius)
+                count += node.size
+                whole += 1
+                continue
+            candidates += 1
+            if node.distanceTo(center) <= radius:
+                count += 1
+            for child in (node.left, node.right):
+                if child is not None:
+                    stack.append(child)
+                    pushes += 1
+        self.stats.record("count", visited, pruned, pushes + visited, candidates, whole)
+        return count
+
+    def _closestSquare(self, point, start=None, best=None):
+        '''
+            То же, что KdTree._closestSquare, со сбором счётчиков.
+        '''
+        min_node = None
+        shrink = (1 + self.epsilon)**2
+        visited = pruned = candidates = 0
+        stack = [start or self.root] if self.root is not None else []
+        pushes = len(stack)
+        while stack:
+            node = stack.pop()
+            visited += 1
+            if best is not None:
+                near = node.rect.squareDistanceTo(point)
+                if near*shrink > best:
+                    if near <= best:
+                        self._pruned = min(self._pruned, near)
+                    pruned += 1
+                    continue
+            candidates += 1
+            dist = _squareDistance(node.point, point)
+            if dist > 0 and (best is None or dist < best):
+                best = dist
+                min_node = node
+            if point[node.coord] < node.point[node.coord]:
+                near, far = node.left, node.right
+            else:
+                near, far = node.right, node.left
+            for child in (far, near):
+                if child is not None:
+                    stack.append(child)
+                    pushes += 1
+        self._recordSearch("closest", visited, pruned, pushes + visited, candidates)
+        return min_node, best
+
+    def _nearestSquares(self, point, k, start=None, heap=None):
+        '''
+            То же, что KdTree._nearestSquares, со сбором счётчиков.
+        '''
+        if heap is None:
+            heap = []
+        shrink = (1 + self.epsilon)**2
+        visited = pruned = candidates = 0
+        stack = [start or self.root] if self.root is not None else []
+        pushes = len(stack)
+        while stack:
+            node = stack.pop()
+            visited += 1
+            if len(heap) == k:
+                near = node.rect.squareDistanceTo(point)
+                if near*shrink > -heap[0][0]:
+                    if near <= -heap[0][0]:
+                        self._pruned = min(self._pruned, near)
+                    pruned += 1
+                    continue
+            candidates += 1
+            dist = _squareDistance(node.point, point)
+            if dist > 0:
+                _offerSquare(heap, k, dist, node.point)
+            if point[node.coord] < node.point[node.coord]:
+                near, far = node.left, node.right
+            else:
+                near, far = node.right, node.left
+            for child in (far, near):
+                if child is not None:
+                    stack.append(child)
+                    pushes += 1
+        self._recordSearch("nearest", visited, pruned, pushes + visited, candidates)
+        return heap
+
+    def _recordSearch(self, kind, visited, pruned, stackOps, candidates):
+        '''
+            Учесть поиск ближайших точек как отдельный запрос либо,
+            если вычисляется ответ точки, прибавить его счётчики
+            к счётчикам её запроса. Аргументы:
+                kind - вид поиска
+                visited, pruned, stackOps, candidates -
+                       значения счётчиков поиска
+        '''
+        if self._query is None:
+            self.stats.record(kind, visited, pruned, stackOps, candidates)
+            return
+        self._query[0] += visited
+        self._query[1] += pruned
+        self._query[2] += stackOps
+        self._query[3] += candidates
+
+    def _radiusAndNeighborsFrom(self, path):
+        '''
+            То же, что KdTree._radiusAndNeighborsFrom, со сбором
+            счётчиков. Поиски в поддеревьях, пройденных при подъёме
+            к предкам, и проверки точек предков учитываются вместе,
+            одним запросом на точку.
+        '''
+        point = path[-1].point
+        self._pruned = math.inf
+        self._query = [0, 0, 0, 0]
+        try:
+            if self.k == 1:
+                closest, best = self._closestSquare(point, path[-1])
+            else:
+                heap = self._nearestSquares(point, self.k, path[-1])
+                best = -heap[0][0] if len(heap) == self.k else None
+            grow = 1 + self.epsilon
+            level = len(path)-1
+            while level > 0 and (best is None or
+                    not path[level].rect.containsCircle(point, math.sqrt(best)/grow)):
+                parent = path[level-1]
+                sibling = parent.left if parent.right is path[level] else parent.right
+                self._query[3] += 1 # точка предка
+                if self.k == 1:
+                    dist = _squareDistance(parent.point, point)
+                    if best is None or dist < best:
+                        best = dist
+                    if sibling is not None:
+                        closest, best = self._closestSquare(point, sibling, best)
+                else:
+                    _offerSquare(heap, self.k, _squareDistance(parent.point, point), parent.point)
+                    if sibling is not None:
+                        self._nearestSquares(point, self.k, sibling, heap)
+                    best = -heap[0][0] if len(heap) == self.k else None
+                level -= 1
+            query = self._query
+        finally:
+            self._query = None
+        self.stats.record("closest" if self.k == 1 else "nearest", *query)
+        if best is not None and level > 0 and grow > 1 and \
+                not path[level].rect.containsCircle(point, math.sqrt(best)):
+            self._pruned = min(self._pruned, best/(grow*grow))
+        self._recordRadius(best if best is not None else math.inf)
+        radius = math.sqrt(best) if best is not None else math.inf
+        bound = self.multiplier*radius
+        level = len(path)-1
+        while level > 0 and not path[level].rect.containsCircle(point, bound):
+            level -= 1
+        return radius, self.countInCircle(point, bound, path[level]) - 1
+
 class Node:
     '''
         Класс, реулизующий узел структуры данных Kd-Tree.
@@ -140,8 +1058,8 @@ class Node:
 
     def __init__(self, point, coord=0, rect=None):
         '''
-            point - кортеж координат (x,y)
-            coord - координата разбиения потомков: 0 - х, 1 - у
+            point - кортеж координат точки
+            coord - номер координаты разбиения потомков (0 - х, 1 - у, ...)
             rect  - прямоугольник, в котором лежат все потомки
                     данного узла
         '''
@@ -150,18 +1068,10 @@ class Node:
         if rect is not None:
             self.rect = rect
         else:
-            self.rect = Rectangle() # бесконечный прямоугольник
+            self.rect = Rectangle(dims=len(point)) # бесконечный прямоугольник
         self.left = None # левый дочерний узел
         self.right = None # правый дочерний узел
-    
-    def __lt__(self, other):
-        '''
-            Сравнить два узла по координатам их точек.
-            Метод нужен для корректной работы PriorityQueue.
-        '''
-        if not isinstance(other, Node):
-            raise ValueError("Unorderable types: Node() < {}()".format(other.__class__.__name__))
-        return self.coord < other.coord
+        self.size = 1 # число узлов в поддереве данного узла
     
     def next(self, point):
         '''
@@ -183,7 +1093,7 @@ class Node:
         '''
         ind = int(point[self.coord] >= self.point[self.coord])
         rect = self.rect.split(self.point[self.coord], coord=self.coord)[ind]
-        leaf = Node(point, (self.coord+1)%2, rect=rect)
+        leaf = Node(point, (self.coord+1)%len(point), rect=rect)
         if ind == 0:
             assert self.left is None
             self.left = leaf
@@ -196,24 +1106,27 @@ class Node:
         '''
             Вернуть расстояние от точки узла до заданной точки.
             Аргументы:
-                point - кортеж координат (x,y) либо объект Node
+                point - кортеж координат точки либо объект Node
         '''
         if isinstance(point, Node):
             point = point.point
-        return math.sqrt((self.point[0]-point[0])**2 + (self.point[1]-point[1])**2)
+        return math.sqrt(_squareDistance(self.point, point))
 
 class Rectangle:
     '''
-        Класс, реализующий прямоугольную область на плоскости.
-        Область может быть ограничена менее, чем с четырёх сторон.
+        Класс, реализующий прямоугольную область (на плоскости или,
+        в общем случае, в пространстве любой размерности). Область
+        может быть ограничена не со всех сторон.
     '''
     
-    def __init__(self, coords=None):
+    def __init__(self, coords=None, dims=2):
         '''
             coords - список отрезков, ограничивающих область
-                     по каждой координате: [(x1,x2), (y1,y2)].
+                     по каждой координате: [(x1,x2), (y1,y2), ...].
                      None вместо координаты означает отсутствие
                      соответствюущего ограничения.
+            dims   - число координат бесконечной области
+                     (если coords не задан)
         '''
         if coords is not None:
             for pair in coords:
@@ -223,39 +1136,44 @@ class Rectangle:
             self.coords = coords
         else:
             # Бесконечный прямоугольник:
-            self.coords = [(None, None), (None, None)]
-
-    @classmethod
-    def centeredIn(cls, center, width, height):
-        '''
-            Вернуть прямоугольник с центром в center, шириной
-            width и высотой height. Аргументы:
-                point  - кортеж координат (x,y)
-                width  - ширина прямоугольника
-                height - высота прямоугольника
-        '''
-        return cls([(center[0]-width/2, center[0]+width/2),
-                       (center[1]-height/2, center[1]+height/2)])
+            self.coords = [(None, None)] * dims
 
     def distanceTo(self, point):
         '''
             Вернуть кратчайшее расстояние от заданной точки
             до данного прямоугольника. Аргументы:
-                point - кортеж координат (x,y)
+                point - кортеж координат точки
         '''
-        if self.coords[0][0] is not None and point[0] < self.coords[0][0]:
-            x = self.coords[0][0]
-        elif self.coords[0][1] is not None and self.coords[0][1] < point[0]:
-            x = self.coords[0][1]
-        else:
-            x = point[0]
-        if self.coords[1][0] is not None and point[1] < self.coords[1][0]:
-            y = self.coords[1][0]
-        elif self.coords[1][1] is not None and self.coords[1][1] < point[1]:
-            y = self.coords[1][1]
-        else:
-            y = point[1]
-        return math.sqrt((point[0]-x)**2 + (point[1]-y)**2)
+        return math.sqrt(self.squareDistanceTo(point))
+
+    def squareDistanceTo(self, point):
+        '''
+            Вернуть квадрат кратчайшего расстояния от заданной
+            точки до данного прямоугольника. Аргументы:
+                point - кортеж координат точки
+        '''
+        square = 0.0
+        for value, (lo, hi) in zip(point, self.coords):
+            if lo is not None and value < lo:
+                square += (value - lo)*(value - lo)
+            elif hi is not None and hi < value:
+                square += (value - hi)*(value - hi)
+        return square
+
+    def farthestDistanceTo(self, point):
+        '''
+            Вернуть расстояние от заданной точки до самой дальней
+            точки прямоугольника (бесконечность, если прямоугольник
+            не ограничен). Аргументы:
+                point - кортеж координат точки
+        '''
+        square = 0.0
+        for value, (lo, hi) in zip(point, self.coords):
+            if lo is None or hi is None:
+                return float("inf")
+            side = max(value - lo, hi - value)
+            square += side*side
+        return math.sqrt(square)
 
     def intersectsWith(self, rect):
         '''
@@ -273,22 +1191,46 @@ class Rectangle:
                     if vertex is not None and (x1 is None or x1 <= vertex) and (x2 is None or vertex <= x2):
                         return True
             return False
-        return segments_intersect(self.coords[0], rect.coords[0]) and \
-            segments_intersect(self.coords[1], rect.coords[1])
+        return all(segments_intersect(seg1, seg2)
+                   for seg1, seg2 in zip(self.coords, rect.coords))
 
     def hasInside(self, point):
         '''
             Вернуть True, если данная точка находится внутри
             прямоугольника, иначе False. Аргументы:
-                point - кортеж координат (x,y)
+                point - кортеж координат точки
         '''
-        for coord in range(2):
+        for coord in range(len(self.coords)):
             if self.coords[coord][0] is not None and point[coord] < self.coords[coord][0]:
                 return False
             if self.coords[coord][1] is not None and self.coords[coord][1] < point[coord]:
                 return False
         return True
 
+    def containsCircle(self, center, radius):
+        '''
+            Вернуть True, если круг (шар) целиком лежит внутри
+            прямоугольника и не касается его границ, иначе False.
+            Аргументы:
+                center - кортеж координат центра круга
+                radius - радиус круга
+        '''
+        for coord in range(len(self.coords)):
+            for bound in self.coords[coord]:
+                if bound is not None and abs(center[coord]-bound) <= radius:
+                    return False
+        return True
+
+    def innerDistanceTo(self, point):
+        '''
+            Вернуть расстояние от точки внутри прямоугольника до
+            его границы (бесконечность, если прямоугольник не
+            ограничен ни с одной стороны). Аргументы:
+                point - кортеж координат точки
+        '''
+        return min([abs(point[coord]-bound) for coord in range(len(self.coords))
+                    for bound in self.coords[coord] if bound is not None], default=math.inf)
+
     def split(self, value, coord):
         '''
             Вернуть разбиение прямоугольника на два. Аргументы:
@@ -298,46 +1240,1721 @@ class Rectangle:
         assert self.coords[coord][0] is None or self.coords[coord][0] <= value
         assert self.coords[coord][1] is None or value <= self.coords[coord][1]
         r1 = Rectangle([self.coords[crd] if crd != coord
-                        else (self.coords[crd][0], value) for crd in range(2)])
+                        else (self.coords[crd][0], value) for crd in range(len(self.coords))])
         r2 = Rectangle([self.coords[crd] if crd != coord
-                        else (value, self.coords[crd][1]) for crd in range(2)])
+                        else (value, self.coords[crd][1]) for crd in range(len(self.coords))])
         return r1, r2
 
-def parse_file(file):
+class ArrayKdTree:
+    '''
+        Компактная реализация Kd-Tree. Вместо объектов Node и
+        Rectangle узлы хранятся в параллельных массивах array:
+            coords       - координаты точек узлов: x0, y0, x1, y1, ...
+            axis         - координата разбиения узла: 0 - х, 1 - у
+            left, right  - индексы дочерних узлов (-1 - нет потомка)
+            size         - число узлов в поддереве узла
+            lower, upper - углы ограничивающего прямоугольника
+                           всех точек поддерева узла
+        Узлы лежат в массивах в порядке прямого обхода, корень
+        имеет индекс 0. Дерево строится целиком по списку точек
+        методом fromPoints и после построения не изменяется.
+    '''
+
+    def __init__(self):
+        self.coords = array("d")
+        self.axis = array("b")
+        self.left = array("i")
+        self.right = array("i")
+        self.size = array("i")
+        self.lower = array("d")
+        self.upper = array("d")
+
+    @classmethod
+    def fromPoints(cls, points):
+        '''
+            Построить сбалансированное дерево по списку точек.
+            Аргументы:
+                points - список кортежей (x,y)
+        '''
+        tree = cls()
+        # Стек отложенных поддеревьев:
+        # (индекс родителя, массив ссылки на потомка, точки)
+        stack = [(-1, None, points)]
+        while stack:
+            parent, link, points = stack.pop()
+            if not points:
+                continue
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            lower = (min(xs), min(ys))
+            upper = (max(xs), max(ys))
+            # Разбиение по координате с наибольшим разбросом
+            coord = int(upper[1] - lower[1] > upper[0] - lower[0])
+            left, point, right = _medianSplit(points, coord)
+            index = len(tree.axis)
+            if link is not None:
+                link[parent] = index
+            tree.coords.extend(point)
+            tree.axis.append(coord)
+            tree.left.append(-1)
+            tree.right.append(-1)
+            tree.size.append(len(points))
+            tree.lower.extend(lower)
+            tree.upper.extend(upper)
+            # Левое поддерево кладём в стек последним, чтобы
+            # оно шло в массивах сразу за родителем
+            stack.append((index, tree.right, right))
+            stack.append((index, tree.left, left))
+        return tree
+
+    # Заголовок файла индекса: сигнатура с порядком байт платформы,
+    # число узлов и 32-байтный ключ содержимого входного файла
+    INDEX_MAGIC = b"KDTIDX1" + (b"<" if sys.byteorder == "little" else b">")
+    INDEX_HEADER = 48
+    # Массивы файла индекса в порядке записи; order - индексы узлов
+    # точек в порядке входного файла. Сначала идут массивы float64,
+    # поэтому все массивы выровнены по размеру своих элементов.
+    INDEX_ARRAYS = (("coords", "d", 2), ("lower", "d", 2), ("upper", "d", 2),
+                    ("left", "i", 1), ("right", "i", 1), ("size", "i", 1),
+                    ("order", "i", 1), ("axis", "b", 1))
+
+    def save(self, file, points, key):
+        '''
+            Сохранить дерево в файл индекса. Запись атомарна: файл
+            сначала пишется во временный файл рядом. Аргументы:
+                file   - путь к файлу индекса
+                points - список точек в порядке входного файла
+                key    - 32-байтный ключ содержимого входного файла
+        '''
+        nodes = {}
+        for index in range(len(self.axis)):
+            nodes[(self.coords[2*index], self.coords[2*index+1])] = index
+        order = array("i", [nodes[point] for point in points])
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.INDEX_MAGIC + struct.pack("<Q", len(self.axis)) + key)
+                for name, code, width in self.INDEX_ARRAYS:
+                    f.write((order if name == "order" else getattr(self, name)).tobytes())
+            # mkstemp создаёт файл с правами 0600, а файл должен
+            # получить обычные права новых файлов (с учётом umask)
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp, 0o666 & ~umask)
+            os.replace(temp, file)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    @classmethod
+    def load(cls, file, key):
+        '''
+            Открыть файл индекса, сохранённый методом save. Файл
+            отображается в память, и массивы дерева читаются прямо
+            из отображения без копирования. Вернуть кортеж (дерево,
+            список точек в порядке входного файла) либо None, если
+            файла нет или он построен для другого содержимого.
+            Аргументы:
+                file - путь к файлу индекса
+                key  - 32-байтный ключ содержимого входного файла
+        '''
+        try:
+            with open(file, "rb") as f:
+                if os.fstat(f.fileno()).st_size < cls.INDEX_HEADER:
+                    return None
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+        count = struct.unpack("<Q", data[8:16])[0]
+        widths = {code: array(code).itemsize for name, code, width in cls.INDEX_ARRAYS}
+        expected = cls.INDEX_HEADER + sum(count*width*widths[code]
+                                          for name, code, width in cls.INDEX_ARRAYS)
+        if data[:8] != cls.INDEX_MAGIC or data[16:48] != key or len(data) != expected:
+            data.close()
+            return None
+        tree = cls()
+        view = memoryview(data)
+        offset = cls.INDEX_HEADER
+        for name, code, width in cls.INDEX_ARRAYS:
+            end = offset + count*width*widths[code]
+            setattr(tree, name, view[offset:end].cast(code))
+            offset = end
+        coords = tree.coords
+        points = [(coords[2*index], coords[2*index+1]) for index in tree.order]
+        del tree.order
+        return tree, points
+
+    def getRadiusAndNeighbors(self, point):
+        '''
+            Вернуть радиус и число соседей заданной точки.
+            Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        if self._findIndex(point) == -1:
+            raise ValueError("Point not in tree")
+        radius = math.sqrt(self._closestSquare(point))
+        return radius, self.countInCircle(point, 2*radius) - 1
+
+    def allRadiiAndNeighbors(self, part=0, parts=1):
+        '''
+            Вернуть словарь, в котором ключи - все точки дерева,
+            а значения - кортежи (радиус, число_соседей).
+            Работает так же, как KdTree.allRadiiAndNeighbors:
+            прямоугольники разбиения узлов, которых нет в массивах,
+            вычисляются по ходу обхода. Аргументы:
+                part  - номер вычисляемой части
+                parts - число частей
+        '''
+        result = {}
+        if not self.axis:
+            return result
+        coords, axis = self.coords, self.axis
+        split = _splitDepth(parts)
+        subtrees = 0 # число пройденных поддеревьев глубины split
+        path = [] # индексы узлов от корня до текущего
+        cells = [] # прямоугольники разбиения этих узлов
+        stack = [(0, 0, Rectangle())]
+        while stack:
+            index, depth, cell = stack.pop()
+            if depth == split:
+                subtrees += 1
+                if subtrees % parts != part:
+                    continue
+            del path[depth:]
+            del cells[depth:]
+            path.append(index)
+            cells.append(cell)
+            if depth >= split or part == 0:
+                point = (coords[2*index], coords[2*index+1])
+                result[point] = self._radiusAndNeighborsFrom(path, cells)
+            coord = axis[index]
+            lcell, rcell = cell.split(coords[2*index+coord], coord)
+            if self.right[index] != -1:
+                stack.append((self.right[index], depth+1, rcell))
+            if self.left[index] != -1:
+                stack.append((self.left[index], depth+1, lcell))
+        return result
+
+    def _radiusAndNeighborsFrom(self, path, cells):
+        '''
+            Вернуть радиус и число соседей точки последнего узла
+            пути, начиная поиск с поддерева этого узла. Аргументы:
+                path  - список индексов узлов от корня до данного
+                cells - список прямоугольников разбиения этих узлов
+        '''
+        coords = self.coords
+        point = (coords[2*path[-1]], coords[2*path[-1]+1])
+        best = self._closestSquare(point, path[-1])
+        level = len(path)-1
+        while level > 0 and (best is None or
+                not cells[level].containsCircle(point, math.sqrt(best))):
+            parent = path[level-1]
+            dx = coords[2*parent]-point[0]
+            dy = coords[2*parent+1]-point[1]
+            dist = dx*dx + dy*dy
+            if best is None or dist < best:
+                best = dist
+            if self.right[parent] == path[level]:
+                sibling = self.left[parent]
+            else:
+                sibling = self.right[parent]
+            if sibling != -1:
+                best = self._closestSquare(point, sibling, best)
+            level -= 1
+        radius = math.sqrt(best)
+        level = len(path)-1
+        while level > 0 and not cells[level].containsCircle(point, 2*radius):
+            level -= 1
+        return radius, self.countInCircle(point, 2*radius, path[level]) - 1
+
+    def depth(self):
+        '''
+            Вернуть глубину дерева: число узлов на самом длинном
+            пути от корня до листа.
+        '''
+        depth = 0
+        stack = [(0, 1)] if self.axis else []
+        while stack:
+            index, level = stack.pop()
+            depth = max(depth, level)
+            for child in (self.left[index], self.right[index]):
+                if child != -1:
+                    stack.append((child, level+1))
+        return depth
+
+    def _findIndex(self, point):
+        '''
+            Вернуть индекс узла с данной точкой либо -1,
+            если точки нет в дереве. Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        coords, axis = self.coords, self.axis
+        index = 0 if axis else -1
+        while index != -1:
+            if coords[2*index] == point[0] and coords[2*index+1] == point[1]:
+                return index
+            coord = axis[index]
+            if point[coord] < coords[2*index+coord]:
+                index = self.left[index]
+            else:
+                index = self.right[index]
+        return -1
+
+    def _closestSquare(self, point, start=0, best=None):
+        '''
+            Вернуть квадрат расстояния от точки до ближайшей к ней
+            другой точки поддерева, если он меньше best, иначе best.
+            Аргументы:
+                point - кортеж координат (x,y)
+                start - индекс корневого узла поддерева
+                best  - уже найденный квадрат расстояния или None
+        '''
+        coords, axis, left, right = self.coords, self.axis, self.left, self.right
+        lower, upper = self.lower, self.upper
+        x, y = point
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            i = 2*index
+            if best is not None:
+                # Квадрат расстояния до ограничивающего прямоугольника узла
+                if x < lower[i]:
+                    dx = lower[i] - x
+                elif x > upper[i]:
+                    dx = x - upper[i]
+                else:
+                    dx = 0.0
+                if y < lower[i+1]:
+                    dy = lower[i+1] - y
+                elif y > upper[i+1]:
+                    dy = y - upper[i+1]
+                else:
+                    dy = 0.0
+                if dx*dx + dy*dy > best:
+                    continue
+            dx = coords[i]-x
+            dy = coords[i+1]-y
+            dist = dx*dx + dy*dy
+            if dist > 0 and (best is None or dist < best):
+                best = dist
+            # Сначала обходим потомка, в чьей половине лежит точка:
+            # он кладётся в стек последним
+            coord = axis[index]
+            if point[coord] < coords[i+coord]:
+                near, far = left[index], right[index]
+            else:
+                near, far = right[index], left[index]
+            if far != -1:
+                stack.append(far)
+            if near != -1:
+                stack.append(near)
+        return best
+
+    def countInCircle(self, center, radius, start=0):
+        '''
+            Вернуть число точек дерева, лежащих в круге заданного
+            радиуса (включая границу). Работает так же, как
+            KdTree.countInCircle, но по точным ограничивающим
+            прямоугольникам поддеревьев. Аргументы:
+                center - кортеж координат центра круга (x,y)
+                radius - радиус круга
+                start  - индекс корневого узла поддерева
+        '''
+        coords, lower, upper = self.coords, self.lower, self.upper
+        left, right, size = self.left, self.right, self.size
+        x, y = center
+        count = 0
+        stack = [start] if self.axis else []
+        sqrt = math.sqrt
+        while stack:
+            index = stack.pop()
+            i = 2*index
+            # Расстояния по каждой координате до ближайшей (dx, dy)
+            # и до самой дальней (fx, fy) точек прямоугольника
+            x1, x2, y1, y2 = lower[i], upper[i], lower[i+1], upper[i+1]
+            if x < x1:
+                dx = x1 - x
+            elif x > x2:
+                dx = x - x2
+            else:
+                dx = 0.0
+            if y < y1:
+                dy = y1 - y
+            elif y > y2:
+                dy = y - y2
+            else:
+                dy = 0.0
+            if sqrt(dx*dx + dy*dy) > radius:
+                continue
+            fx = x - x1 if x - x1 > x2 - x else x2 - x
+            fy = y - y1 if y - y1 > y2 - y else y2 - y
+            if sqrt(fx*fx + fy*fy) <= radius:
+                count += size[index]
+                continue
+            dx = coords[i]-x
+            dy = coords[i+1]-y
+            if sqrt(dx*dx + dy*dy) <= radius:
+                count += 1
+            if left[index] != -1:
+                stack.append(left[index])
+            if right[index] != -1:
+                stack.append(right[index])
+        return count
+
+class GridIndex:
+    '''
+        Векторизованная реализация на равномерной сетке. Точки
+        раскладываются по квадратным ячейкам и хранятся в массивах
+        NumPy, упорядоченными по номеру ячейки:
+            xs, ys - координаты точек
+            cx, cy - номера столбца и строки ячейки точки
+            start  - start[c] - индекс первой точки ячейки
+                     c = cx*rows + cy, точки ячейки идут подряд
+        Расстояния вычисляются сразу для всех пар "точка - точка
+        соседней ячейки" операциями над массивами, без циклов
+        по точкам. Подходит для примерно равномерно распределённых
+        точек. Требует NumPy.
+    '''
+
+    POINTS_PER_CELL = 2 # среднее число точек в ячейке
+    BATCH_PAIRS = 1 << 22 # максимальное число пар точек за один шаг
+
+    def __init__(self):
+        self.size = 1.0 # сторона ячейки
+        self.lower = (0.0, 0.0) # левый нижний угол сетки
+        self.cols = self.rows = 0 # размеры сетки в ячейках
+        self.xs = self.ys = self.cx = self.cy = self.start = None
+
+    @classmethod
+    def fromPoints(cls, points):
+        '''
+            Разложить точки по ячейкам сетки. Аргументы:
+                points - список кортежей (x,y)
+        '''
+        if np is None:
+            raise ImportError("GridIndex requires NumPy")
+        grid = cls()
+        data = np.array(points, dtype=float).reshape(-1, 2)
+        lower = data.min(axis=0)
+        width, height = data.max(axis=0) - lower
+        grid.lower = tuple(lower.tolist())
+        cells = max(len(data) / cls.POINTS_PER_CELL, 1)
+        # Сторона ячейки выбирается так, чтобы ячеек было порядка
+        # cells и по ширине, и по высоте их было не больше cells
+        size = max(math.sqrt(width*height/cells), max(width, height)/cells)
+        grid.size = size if size > 0 else 1.0
+        grid.cols = int(width // grid.size) + 1
+        grid.rows = int(height // grid.size) + 1
+        cx = np.floor((data[:,0]-lower[0]) / grid.size).astype(np.int64)
+        cy = np.floor((data[:,1]-lower[1]) / grid.size).astype(np.int64)
+        np.clip(cx, 0, grid.cols-1, out=cx)
+        np.clip(cy, 0, grid.rows-1, out=cy)
+        cell = cx*grid.rows + cy
+        order = np.argsort(cell, kind="stable")
+        grid.xs, grid.ys = data[order,0], data[order,1]
+        grid.cx, grid.cy = cx[order], cy[order]
+        grid.start = np.searchsorted(cell[order], np.arange(grid.cols*grid.rows+1))
+        return grid
+
+    def getRadiusAndNeighbors(self, point):
+        '''
+            Вернуть радиус и число соседей заданной точки.
+            Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        index = self._findIndex(point)
+        if index == -1:
+            raise ValueError("Point not in tree")
+        radius, neighbors = self._radiiAndNeighbors(np.array([index]))
+        return radius[0], int(neighbors[0])
+
+    def allRadiiAndNeighbors(self, part=0, parts=1):
+        '''
+            Вернуть словарь, в котором ключи - все точки,
+            а значения - кортежи (радиус, число_соседей).
+            Точки, упорядоченные по ячейкам, делятся на parts
+            непрерывных частей. Аргументы:
+                part  - номер вычисляемой части
+                parts - число частей
+        '''
+        queries = np.array_split(np.arange(len(self.xs)), parts)[part]
+        if len(queries) == 0: # частей больше, чем точек
+            return {}
+        radius, neighbors = self._radiiAndNeighbors(queries)
+        return dict(zip(zip(self.xs[queries].tolist(), self.ys[queries].tolist()),
+                        zip(radius.tolist(), neighbors.tolist())))
+
+    def _findIndex(self, point):
+        '''
+            Вернуть индекс данной точки либо -1, если её нет.
+            Аргументы:
+                point - кортеж координат (x,y)
+        '''
+        if self.xs is None:
+            return -1
+        # Ищем точку среди точек ячейки, в которой она лежала бы
+        cx = min(max(int((point[0]-self.lower[0]) // self.size), 0), self.cols-1)
+        cy = min(max(int((point[1]-self.lower[1]) // self.size), 0), self.rows-1)
+        first, last = self.start[cx*self.rows+cy], self.start[cx*self.rows+cy+1]
+        found = np.flatnonzero((self.xs[first:last] == point[0]) &
+                               (self.ys[first:last] == point[1]))
+        return first + int(found[0]) if len(found) else -1
+
+    def _radiiAndNeighbors(self, queries):
+        '''
+            Вернуть массивы радиусов и чисел соседей точек.
+            Аргументы:
+                queries - массив индексов точек
+        '''
+        limit = max(self.cols, self.rows) # кольцо, покрывающее всю сетку
+        # Радиус: просматриваем кольца ячеек вокруг ячейки точки, пока
+        # найденное расстояние не станет меньше расстояния до
+        # непросмотренных ячеек
+        best = np.full(len(queries), np.inf)
+        active = np.arange(len(queries))
+        ring = 0
+        while len(active):
+            for owners, others in self._ringPairs(queries, active, ring):
+                dist = self._squares(queries[owners], others)
+                dist[dist == 0] = np.inf # сама точка
+                np.minimum.at(best, owners, dist)
+            done = np.sqrt(best[active]) <= (ring - 1e-6)*self.size
+            active = active[~done] if ring < limit else active[:0]
+            ring += 1
+        radius = np.sqrt(best)
+        # Соседи: считаем точки круга двойного радиуса во всех
+        # ячейках, которые он может задеть
+        double = 2*radius
+        rings = np.minimum(np.floor(double/self.size + 1e-6).astype(np.int64) + 1, limit)
+        count = np.zeros(len(queries), dtype=np.int64)
+        for ring in range(int(rings.max()) + 1):
+            active = np.flatnonzero(rings >= ring)
+            for owners, others in self._ringPairs(queries, active, ring):
+                dist = np.sqrt(self._squares(queries[owners], others))
+                inside = owners[dist <= double[owners]]
+                count += np.bincount(inside, minlength=len(queries))
+        return radius, count - 1 # сама точка не считается соседом
+
+    def _squares(self, points, others):
+        '''
+            Вернуть квадраты расстояний между парами точек.
+            Аргументы:
+                points, others - массивы индексов точек пар
+        '''
+        dx = self.xs[others] - self.xs[points]
+        dy = self.ys[others] - self.ys[points]
+        return dx*dx + dy*dy
+
+    def _ringPairs(self, queries, active, ring):
+        '''
+            Перебрать пары (номер запроса, индекс точки) для всех
+            точек ячеек кольца ring вокруг ячеек активных запросов.
+            Пары выдаются порциями не более BATCH_PAIRS штук.
+            Аргументы:
+                queries - массив индексов точек запросов
+                active  - массив номеров активных запросов
+                ring    - номер кольца (0 - сама ячейка)
+        '''
+        for ox, oy in _ringOffsets(ring):
+            cx = self.cx[queries[active]] + ox
+            cy = self.cy[queries[active]] + oy
+            valid = (cx >= 0) & (cx < self.cols) & (cy >= 0) & (cy < self.rows)
+            owners = active[valid]
+            cell = cx[valid]*self.rows + cy[valid]
+            first = self.start[cell]
+            counts = self.start[cell+1] - first
+            ends = np.cumsum(counts)
+            done = 0
+            while done < len(owners):
+                # Берём столько запросов, сколько помещается в порцию
+                stop = max(int(np.searchsorted(ends, ends[done]-counts[done] +
+                    self.BATCH_PAIRS, side="right")), done+1)
+                part = counts[done:stop]
+                total = int(part.sum())
+                if total:
+                    shift = np.arange(total) - np.repeat(np.cumsum(part)-part, part)
+                    yield (np.repeat(owners[done:stop], part),
+                           np.repeat(first[done:stop], part) + shift)
+                done = stop
+
+def _buildSubtree(points, rect=None):
+    '''
+        Построить по медианам поддерево из данных точек и вернуть
+        его корневой узел (None, если точек нет). Каждый узел
+        делит точки по координате с наибольшим разбросом.
+        Аргументы:
+            points - список кортежей координат
+            rect   - прямоугольник корневого узла
+    '''
+    if not points:
+        return None
+    coord = _splitAxis(points)
+    left, point, right = _medianSplit(points, coord)
+    root = Node(point, coord, rect)
+    root.size = len(points)
+    # Стек отложенных поддеревьев: (родительский узел, точки)
+    stack = [(root, left), (root, right)]
+    while stack:
+        parent, points = stack.pop()
+        if not points:
+            continue
+        coord = _splitAxis(points)
+        left, point, right = _medianSplit(points, coord)
+        node = parent.addLeaf(point)
+        node.coord = coord
+        node.size = len(points)
+        stack.append((node, left))
+        stack.append((node, right))
+    return root
+
+def _splitAxis(points):
+    '''
+        Вернуть координату разбиения для данных точек: ту, по
+        которой разброс значений наибольший (при равенстве -
+        меньшую по номеру). Так разбиение уменьшает наибольший
+        размер ячейки, а по координате, где все точки совпадают,
+        разбиения не бывает. Аргументы:
+            points - список кортежей координат
+    '''
+    best, widest = 0, -1.0
+    for coord in range(len(points[0])):
+        values = list(map(itemgetter(coord), points))
+        spread = max(values) - min(values)
+        if spread > widest:
+            best, widest = coord, spread
+    return best
+
+def _squareDistance(p1, p2):
+    '''
+        Вернуть квадрат расстояния между точками. Аргументы:
+            p1, p2 - кортежи координат точек
+    '''
+    square = 0.0
+    for a, b in zip(p1, p2):
+        square += (a - b)*(a - b)
+    return square
+
+def _offerSquare(heap, k, square, point):
+    '''
+        Добавить точку в кучу k ближайших точек, если она ближе
+        самой дальней из них или куча ещё не заполнена (см.
+        KdTree._nearestSquares). Аргументы:
+            heap   - куча пар (-квадрат расстояния, точка)
+            k      - наибольший размер кучи
+            square - квадрат расстояния до точки
+            point  - кортеж координат точки
+    '''
+    if len(heap) < k:
+        heappush(heap, (-square, point))
+    elif square < -heap[0][0]:
+        heapreplace(heap, (-square, point))
+
+def _subtreeNodes(root):
+    '''
+        Вернуть список узлов поддерева в прямом порядке обхода:
+        каждый узел идёт раньше своих потомков. Аргументы:
+            root - корневой узел поддерева
+    '''
+    nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        for child in (node.right, node.left):
+            if child is not None:
+                stack.append(child)
+    return nodes
+
+def _subtreePoints(root):
+    '''
+        Вернуть список точек поддерева. Аргументы:
+            root - корневой узел поддерева
+    '''
+    return [node.point for node in _subtreeNodes(root)]
+
+def _medianSplit(points, coord):
+    '''
+        Разбить список точек по медиане координаты coord.
+        Вернуть кортеж (левые точки, опорная точка, правые точки),
+        где у всех левых точек координата строго меньше, чем у
+        опорной, а у правых - не меньше (как в Node.next).
+        Аргументы:
+            points - список кортежей (x,y)
+            coord  - номер координаты разбиения
+    '''
+    points = sorted(points, key=itemgetter(coord))
+    mid = len(points)//2
+    value = points[mid][coord]
+    # Точки с одинаковой координатой должны оказаться по одну
+    # сторону от опорной, поэтому сдвигаем опорную точку к началу
+    # или за конец серии равных значений - куда ближе.
+    first = mid
+    while first > 0 and points[first-1][coord] == value:
+        first -= 1
+    last = mid
+    while last+1 < len(points) and points[last+1][coord] == value:
+        last += 1
+    if last+1 < len(points) and last+1-mid < mid-first:
+        mid = last+1
+    else:
+        mid = first
+    return points[:mid], points[mid], points[mid+1:]
+
+def _splitDepth(parts):
+    '''
+        Вернуть глубину дерева, поддеревья которой распределяются
+        между parts частями работы: на ней не меньше 4 поддеревьев
+        на каждую часть. Аргументы:
+            parts - число частей
+    '''
+    return (4*parts - 1).bit_length()
+
+def _answer_part(args):
+    '''
+        Вычислить часть ответов в процессе-обработчике. Дерево
+        не передаётся через pickle, а берётся из глобальной
+        переменной _shared_tree, унаследованной при fork.
+        Для KdTree вернуть кортеж (ответы, счётчики этой части:
+        достигнутая погрешность и, для ProfiledKdTree, счётчики
+        поиска), иначе - ответы. Аргументы:
+            args - кортеж (номер части, число частей)
+    '''
+    if isinstance(_shared_tree, KdTree):
+        _shared_tree._resetCounters()
+        return _shared_tree.allRadiiAndNeighbors(*args), _shared_tree._counters()
+    return _shared_tree.allRadiiAndNeighbors(*args)
+
+_shared_tree = None # дерево, разделяемое с процессами-обработчиками
+
+def parallel_answers(tree, workers):
+    '''
+        Вернуть словарь ответов для всех точек дерева, вычисленный
+        в workers процессах. Процессы создаются через fork после
+        построения дерева и читают его без копирования (для
+        ArrayKdTree и GridIndex это плоские буферы, страницы которых
+        не изменяются). Если fork недоступен, ответы вычисляются
+        в текущем процессе. Аргументы:
+            tree    - построенное дерево
+            workers - число процессов
+    '''
+    global _shared_tree
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return tree.allRadiiAndNeighbors()
+    parts = 4*workers # с запасом, чтобы процессы загружались равномерно
+    _shared_tree = tree
+    try:
+        answers = {}
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for result in pool.imap_unordered(_answer_part,
+                    [(part, parts) for part in range(parts)]):
+                if isinstance(tree, KdTree):
+                    result, counters = result
+                    tree._mergeCounters(counters)
+                answers.update(result)
+    finally:
+        _shared_tree = None
+    return answers
+
+def _ringOffsets(ring):
+    '''
+        Вернуть список смещений (dx,dy) ячеек квадратного кольца
+        с номером ring вокруг ячейки (0,0). Аргументы:
+            ring - номер кольца (0 - сама ячейка)
+    '''
+    if ring == 0:
+        return [(0, 0)]
+    offsets = [(dx, dy) for dx in (-ring, ring) for dy in range(-ring, ring+1)]
+    offsets += [(dx, dy) for dy in (-ring, ring) for dx in range(-ring+1, ring)]
+    return offsets
+
+class TiledSolver:
+    '''
+        Решение задачи для наборов точек, которые не помещаются
+        в память целиком. Входной файл читается порциями дважды.
+        При первом чтении собирается случайная выборка точек, по
+        которой пространство делится на плитки так же, как KdTree
+        делит точки по медианам, и оценивается ширина полосы
+        (halo) каждой плитки. При втором чтении каждая точка
+        дописывается в файл своей плитки и в файлы полос тех
+        плиток, до которых она не дальше ширины их полосы.
+
+        Плитки обрабатываются независимо друг от друга (в том
+        числе в разных процессах): по точкам плитки и её полосы
+        строится KdTree. Ответ точки плитки верен, если её круг
+        соседей (радиус, умноженный на multiplier) не выходит за
+        полосу; для остальных точек полоса расширяется до их кругов
+        соседей, и поиск продолжается по точкам соседних плиток,
+        которые читаются по одной. Ответы плиток сохраняются в файлы, упорядоченные
+        так же, как вывод, и затем сливаются в общий вывод.
+        В памяти одновременно находятся точки одной плитки
+        с полосой и одной соседней плитки (для каждого процесса).
+    '''
+
+    SAMPLE = 1 << 16 # размер случайной выборки точек
+    HALO = 2         # запас ширины полосы относительно оценки по выборке
+    BUFFER = 1 << 21 # число значений во всех буферах файлов до записи на диск
+    MARGIN = 1e-9    # запас на погрешность вычислений (доля модуля координат)
+
+    def __init__(self, directory, tileSize=1 << 18, k=1, multiplier=2, order="sorted"):
+        '''
+            directory     - каталог для файлов плиток
+            tileSize      - желаемое число точек плитки
+            k, multiplier - см. KdTree.__init__
+            order         - порядок вывода: sorted (по координатам)
+                            или input (как во входном файле)
+        '''
+        self.directory = directory
+        self.tileSize = tileSize
+        self.k = k
+        self.multiplier = multiplier
+        self.order = order
+        self.count = 0      # число точек
+        self.dims = None    # число координат точки
+        self.splits = None  # дерево разбиения: [координата, значение,
+                            # левое, правое] или номер плитки
+        self.tiles = []     # прямоугольники плиток (Rectangle)
+        self.halos = []     # ширина полосы каждой плитки
+        self.margin = 0.0   # допустимая погрешность расстояний
+        self.stats = {}     # сводка по обработке плиток (см. solve)
+
+    def partition(self, file, fmt="auto"):
+        '''
+            Разбить точки файла на плитки и записать файлы плиток
+            и их полос. При ошибке во входных данных возбуждается
+            ValueError. Аргументы:
+                file - путь к входному файлу
+                fmt  - формат файла (см. parse_file)
+        '''
+        rnd = random.Random(0)
+        sample = []
+        low = high = None # границы значений каждой координаты
+        for batch in read_batches(file, fmt):
+            if self.dims is None:
+                self.dims = len(batch[0])
+                low, high = list(batch[0]), list(batch[0])
+            for coord in range(self.dims):
+                values = list(map(itemgetter(coord), batch))
+                low[coord] = min(low[coord], min(values))
+                high[coord] = max(high[coord], max(values))
+            # Выборка с резервуаром: каждая точка попадает в выборку
+            # с вероятностью SAMPLE/count
+            for point in batch:
+                self.count += 1
+                if len(sample) < self.SAMPLE:
+                    sample.append(point)
+                elif rnd.random()*self.count < self.SAMPLE:
+                    sample[rnd.randrange(self.SAMPLE)] = point
+        if self.count < 2 or self.count <= self.k:
+            raise ValueError("at least {} points expected".format(max(2, self.k + 1)))
+        self.margin = self.MARGIN * max(map(abs, low + high))
+        self._estimateHalos(sample, self._splitSample(sample))
+        self._distribute(file, fmt)
+
+    def _splitSample(self, sample):
+        '''
+            Построить дерево разбиения пространства на плитки по
+            медианам выборки так, чтобы на плитку приходилось около
+            tileSize точек. Вернуть список точек выборки каждой
+            плитки. Аргументы:
+                sample - список точек выборки
+        '''
+        tiles = -(-self.count // self.tileSize)
+        leaf = -(-len(sample) // tiles) # число точек выборки плитки
+        samples = []
+        root = [None]
+        # Стек отложенных областей: (родитель, номер поля, точки, прямоугольник)
+        stack = [(root, 0, sample, Rectangle(dims=self.dims))]
+        while stack:
+            parent, slot, points, rect = stack.pop()
+            if len(points) > leaf:
+                coord = _splitAxis(points)
+                left, pivot, right = _medianSplit(points, coord)
+                if left: # иначе все точки совпадают, и делить нечего
+                    node = [coord, pivot[coord], None, None]
+                    parent[slot] = node
+                    lower, upper = rect.split(pivot[coord], coord)
+                    stack.append((node, 2, left, lower))
+                    stack.append((node, 3, [pivot] + right, upper))
+                    continue
+            parent[slot] = len(self.tiles)
+            self.tiles.append(rect)
+            samples.append(points)
+        self.splits = root[0]
+        return samples
+
+    def _estimateHalos(self, sample, samples):
+        '''
+            Оценить ширину полосы каждой плитки по радиусам точек
+            выборки: радиус в выборке, уменьшенный с учётом её
+            меньшей плотности, оценивает радиус точки во всём наборе.
+            Аргументы:
+                sample  - список точек выборки
+                samples - списки точек выборки каждой плитки
+        '''
+        tree = KdTree.fromPoints(sample, self.k)
+        scale = (len(sample) / self.count) ** (1 / self.dims)
+        self.halos = []
+        for points in samples:
+            radii = []
+            for point in points:
+                nearest = tree.nearestNeighbors(point)
+                radii.append(nearest[-1][0] if len(nearest) == self.k else math.inf)
+            radii.sort()
+            self.halos.append(self.HALO * self.multiplier * scale * radii[len(radii)//2])
+
+    def _distribute(self, file, fmt):
+        '''
+            Прочитать файл повторно и дописать каждую точку (с её
+            номером во входном файле) в файл её плитки, а также
+            в файлы полос соседних плиток. Аргументы:
+                file, fmt - см. partition
+        '''
+        for index in range(len(self.tiles)):
+            for kind in ("tile", "halo", "result"):
+                if os.path.exists(self._path(kind, index)):
+                    os.remove(self._path(kind, index))
+        cores = [array("d") for _ in self.tiles]
+        halos = [array("d") for _ in self.tiles]
+        buffers = [(self._path(kind, index), values)
+                   for kind, arrays in (("tile", cores), ("halo", halos))
+                   for index, values in enumerate(arrays)]
+        reach = max(self.halos)
+        number = 0
+        buffered = 0
+        for batch in read_batches(file, fmt):
+            for point in batch:
+                home = self._tileOf(point)
+                values = cores[home]
+                values.extend(point)
+                values.append(number)
+                number += 1
+                buffered += len(point) + 1
+                for index in self._halosOf(point, home, reach):
+                    halos[index].extend(point)
+                    buffered += len(point)
+                if buffered > self.BUFFER:
+                    buffered = self._flushLargest(buffers, self.BUFFER // 2)
+        for path, values in buffers:
+            self._append(path, values)
+
+    def _flushLargest(self, buffers, limit):
+        '''
+            Записать на диск самые большие буферы, пока в остальных
+            не останется не больше limit значений. Вернуть число
+            значений в оставшихся буферах. Аргументы:
+                buffers - список пар (путь к файлу, массив array("d"))
+                limit   - допустимое число значений в буферах
+        '''
+        total = sum(len(values) for path, values in buffers)
+        for path, values in sorted(buffers, key=lambda pair: len(pair[1]), reverse=True):
+            if total <= limit:
+                break
+            total -= len(values)
+            self._append(path, values)
+        return total
+
+    def _tileOf(self, point):
+        '''
+            Вернуть номер плитки, в которой лежит точка.
+            Аргументы:
+                point - кортеж координат точки
+        '''
+        node = self.splits
+        while isinstance(node, list):
+            node = node[2] if point[node[0]] < node[1] else node[3]
+        return node
+
+    def _halosOf(self, point, home, reach):
+        '''
+            Вернуть список номеров плиток (кроме home), в полосу
+            которых попадает точка. Аргументы:
+                point - кортеж координат точки
+                home  - номер плитки точки
+                reach - наибольшая ширина полосы
+        '''
+        result = []
+        stack = [self.splits]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                coord, value, left, right = node
+                gap = point[coord] - value
+                if gap < 0:
+                    stack.append(left)
+                    if -gap <= reach:
+                        stack.append(right)
+                else:
+                    stack.append(right)
+                    if gap <= reach:
+                        stack.append(left)
+            elif node != home:
+                halo = self.halos[node]
+                if self.tiles[node].squareDistanceTo(point) <= halo*halo:
+                    result.append(node)
+        return result
+
+    def solve(self, workers=1):
+        '''
+            Вычислить ответы для всех плиток в workers процессах
+            (процессы создаются через fork; если он недоступен,
+            плитки обрабатываются в текущем процессе) и сохранить
+            сводку в поле stats. Аргументы:
+                workers - число процессов
+        '''
+        tasks = [(self, index) for index in range(len(self.tiles))]
+        self.stats = {"tiles": len(self.tiles), "halo_points": 0,
+                      "second_pass": 0, "second_pass_points": 0}
+        if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            results = list(map(_solve_tile, tasks))
+        else:
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                results = list(pool.imap_unordered(_solve_tile, tasks))
+        for result in results:
+            for key, value in result.items():
+                self.stats[key] += value
+
+    def solveTile(self, index):
+        '''
+            Вычислить ответы для точек плитки и записать их в файл
+            результатов плитки. Вернуть словарь с числом точек
+            полосы, точек, для которых понадобился второй проход,
+            и точек соседних плиток, просмотренных при втором проходе.
+            Аргументы:
+                index - номер плитки
+        '''
+        core, numbers = self._readTile("tile", index)
+        if len(set(core)) != len(core):
+            raise ValueError("duplicate points are not supported")
+        halo = self._readTile("halo", index)[0]
+        tree = KdTree.fromPoints(core + halo, self.k, self.multiplier)
+        answers = tree.allRadiiAndNeighbors()
+        # Точки, круг соседей которых может выходить за полосу
+        rect, width = self.tiles[index], self.halos[index]
+        failed = [point for point in core if self.multiplier*answers[point][0] + self.margin >
+                  width + rect.innerDistanceTo(point)]
+        loaded = 0
+        if failed:
+            second, loaded = self._secondPass(index, tree, failed,
+                                              [answers[point][0] for point in failed])
+            answers.update(second)
+        self._writeResults(index, core, numbers, answers)
+        return {"halo_points": len(halo), "second_pass": len(failed),
+                "second_pass_points": loaded}
+
+    def _secondPass(self, index, tree, points, radii):
+        '''
+            Вычислить точные ответы для точек плитки, круг соседей
+            которых может выходить за полосу. Вернуть словарь ответов
+            и число точек соседних плиток, просмотренных при поиске.
+            Найденные по плитке с полосой радиусы не меньше точных,
+            поэтому нужны только точки, не вошедшие в полосу, из
+            прямоугольника, содержащего круги соседей с этими
+            радиусами. Соседние плитки читаются по одной, дважды:
+            сначала поиск k ближайших продолжается по их точкам с той
+            же кучей, затем с окончательными радиусами считаются
+            соседи. Аргументы:
+                index  - номер плитки
+                tree   - KdTree по точкам плитки и её полосы
+                points - список точек
+                radii  - найденные по tree радиусы точек
+        '''
+        box = self._circlesBox(points, radii)
+        heaps = [tree._nearestSquares(point, self.k) for point in points]
+        loaded = 0
+        for rect, outer in self._outerTrees(index, box):
+            loaded += outer.root.size
+            for point, heap in zip(points, heaps):
+                # Точки плитки ближе k-й найденной, только если
+                # ближе её прямоугольник
+                if len(heap) < self.k or rect.squareDistanceTo(point) <= -heap[0][0]:
+                    outer._nearestSquares(point, self.k, None, heap)
+        radii = [tree._radiusFrom(heap) for heap in heaps]
+        radii = [radius if radius is not None else math.inf for radius in radii]
+        counts = [tree.countInCircle(point, self.multiplier*radius) - 1
+                  for point, radius in zip(points, radii)]
+        for rect, outer in self._outerTrees(index, box):
+            for number, (point, radius) in enumerate(zip(points, radii)):
+                bound = self.multiplier*radius
+                if rect.distanceTo(point) <= bound + self.margin:
+                    counts[number] += outer.countInCircle(point, bound)
+        return dict(zip(points, zip(radii, counts))), loaded
+
+    def _circlesBox(self, points, radii):
+        '''
+            Вернуть прямоугольник, содержащий круги соседей данных
+            точек (с запасом на погрешность вычислений). Аргументы:
+                points - список точек
+                radii  - радиусы точек
+        '''
+        reach = [self.multiplier*radius + 2*self.margin for radius in radii]
+        coords = []
+        for coord in range(self.dims):
+            lo = min(point[coord] - width for point, width in zip(points, reach))
+            hi = max(point[coord] + width for point, width in zip(points, reach))
+            coords.append((lo if lo > -math.inf else None, hi if hi < math.inf else None))
+        return Rectangle(coords)
+
+    def _outerTrees(self, index, rect):
+        '''
+            Для каждой другой плитки, пересекающей прямоугольник,
+            вернуть (через yield) её прямоугольник и KdTree по её
+            точкам, лежащим в прямоугольнике, но не в полосе плитки
+            (проверка та же, что в _halosOf). Файлы плиток читаются
+            по одному. Аргументы:
+                index - номер плитки
+                rect  - объект Rectangle
+        '''
+        home, width = self.tiles[index], self.halos[index]
+        for other, tile in enumerate(self.tiles):
+            if other != index and tile.intersectsWith(rect):
+                points = [point for point in self._readTile("tile", other)[0]
+                          if rect.hasInside(point) and
+                          home.squareDistanceTo(point) > width*width]
+                if points:
+                    yield tile, KdTree.fromPoints(points, self.k, self.multiplier)
+
+    def _writeResults(self, index, core, numbers, answers):
+        '''
+            Записать ответы для точек плитки в файл результатов
+            в порядке вывода: записи (координаты, радиус, число
+            соседей, номер во входном файле). Аргументы:
+                index   - номер плитки
+                core    - список точек плитки
+                numbers - номера точек во входном файле
+                answers - словарь ответов
+        '''
+        records = list(zip(core, numbers))
+        if self.order == "sorted":
+            records.sort()
+        else:
+            records.sort(key=itemgetter(1))
+        values = array("d")
+        for point, number in records:
+            values.extend(point)
+            values.extend(answers[point])
+            values.append(number)
+        self._append(self._path("result", index), values)
+
+    def writeResults(self, writer):
+        '''
+            Слить файлы результатов плиток и записать ответы
+            для всех точек в порядке вывода. Аргументы:
+                writer - объект ResultWriter
+        '''
+        writer.writeHeader(self.count, self.dims)
+        points, answers = [], {}
+        for point, answer in self.iterAnswers():
+            points.append(point)
+            answers[point] = answer
+            if len(points) == writer.BATCH:
+                writer.writeBatch(points, answers)
+                points, answers = [], {}
+        writer.writeBatch(points, answers)
+        writer.stream.flush()
+
+    def iterAnswers(self):
+        '''
+            Вернуть (генератор) пары (точка, (радиус, число_соседей))
+            для всех точек в порядке вывода, сливая файлы
+            результатов плиток.
+        '''
+        for key, point, answer in merge(*[self._results(index)
+                                          for index in range(len(self.tiles))]):
+            yield point, answer
+
+    def _results(self, index):
+        '''
+            Читать файл результатов плитки порциями и возвращать
+            (генератор) кортежи (ключ порядка вывода, точка, ответ).
+            Аргументы:
+                index - номер плитки
+        '''
+        path = self._path("result", index)
+        stride = self.dims + 3
+        # Порция на плитку тем меньше, чем больше плиток сливается
+        size = 8*stride*max(256, READ_BATCH // len(self.tiles))
+        offset = 0
+        while os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size)
+            if not data:
+                return
+            offset += len(data)
+            values = array("d", data)
+            points = zip(*[values[coord::stride] for coord in range(self.dims)])
+            for point, radius, count, number in zip(points, values[self.dims::stride],
+                    values[self.dims+1::stride], values[self.dims+2::stride]):
+                yield (point if self.order == "sorted" else number), point, (radius, int(count))
+
+    def _readTile(self, kind, index):
+        '''
+            Прочитать файл плитки или полосы и вернуть кортеж
+            (список точек, номера точек во входном файле).
+            Аргументы:
+                kind  - "tile" (точки с номерами) или "halo"
+                index - номер плитки
+        '''
+        values = array("d")
+        path = self._path(kind, index)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                values.frombytes(f.read())
+        stride = self.dims + (kind == "tile")
+        points = list(zip(*[values[coord::stride] for coord in range(self.dims)]))
+        return points, values[self.dims::stride]
+
+    def _path(self, kind, index):
+        '''
+            Вернуть путь к файлу плитки. Аргументы:
+                kind  - вид файла: tile, halo или result
+                index - номер плитки
+        '''
+        return os.path.join(self.directory, "{}{}.f64".format(kind, index))
+
+    @staticmethod
+    def _append(path, values):
+        '''
+            Дописать значения в файл и очистить буфер.
+            Аргументы:
+                path   - путь к файлу
+                values - массив array("d")
+        '''
+        if values:
+            with open(path, "ab") as f:
+                values.tofile(f)
+            del values[:]
+
+def _solve_tile(args):
+    '''
+        Обработать плитку в процессе-обработчике.
+        Аргументы:
+            args - кортеж (TiledSolver, номер плитки)
+    '''
+    solver, index = args
+    return solver.solveTile(index)
+
+class ResultWriter:
+    '''
+        Класс, записывающий ответы для точек в поток в одном
+        из форматов (см. FORMATS):
+            text   - строки "(x, y): radius R, neighbors K"
+            csv    - строка заголовка и строки "x,y,radius,neighbors"
+            jsonl  - по объекту JSON {"x", "y", "radius", "neighbors"}
+                     на строке
+            binary - четвёрки float64 (x, y, radius, neighbors) подряд
+            npy    - массив NumPy float64 формы (N,4) с теми же полями
+        Для точек с d координатами вместо x, y выводятся все d
+        координат (x, y, z при d <= 3, иначе x1, ..., xd).
+        Ответы форматируются и записываются порциями по BATCH точек.
+    '''
+
+    FORMATS = ("text", "csv", "jsonl", "binary", "npy")
+    BATCH = 1 << 16 # число точек в одной порции записи
+
+    # Шаблоны строк текстовых форматов; {coords} заменяется на
+    # шаблоны координат точки (см. _lineTemplate)
+    LINES = {
+        "text": "{{}}: radius {{}}, neighbors {{}}",
+        "csv": "{coords},{{1!r}},{{2}}",
+        "jsonl": '{{{{{coords}, "radius": {{1!r}}, "neighbors": {{2}}}}}}',
+    }
+    # Шаблон одной координаты в каждом из текстовых форматов
+    COORDS = {"csv": "{{0[{index}]!r}}", "jsonl": '"{name}": {{0[{index}]!r}}'}
+
+    def __init__(self, stream, fmt="text"):
+        '''
+            stream - двоичный поток вывода
+            fmt    - формат вывода
+        '''
+        if fmt not in self.FORMATS:
+            raise ValueError("Unknown output format: {}".format(fmt))
+        self.stream = stream
+        self.fmt = fmt
+        self.line = None # шаблон строки текстового формата (см. writeHeader)
+
+    def writeAll(self, points, answers):
+        '''
+            Записать ответы для точек в заданном порядке.
+            Аргументы:
+                points  - список кортежей (x,y) в порядке вывода
+                answers - словарь {точка: (радиус, число_соседей)}
+        '''
+        self.writeHeader(len(points), len(points[0]) if points else 2)
+        for start in range(0, len(points), self.BATCH):
+            self.writeBatch(points[start:start+self.BATCH], answers)
+        self.stream.flush()
+
+    def writeHeader(self, count, dims):
+        '''
+            Записать заголовок вывода (для csv и npy) перед
+            порциями ответов. Аргументы:
+                count - общее число точек
+                dims  - число координат точки
+        '''
+        if self.fmt == "csv":
+            names = _columnNames(dims) + ["radius", "neighbors"]
+            self.stream.write((",".join(names) + "\n").encode())
+        elif self.fmt == "npy":
+            self.stream.write(_npy_header_bytes((count, dims+2)))
+        if self.fmt in self.LINES:
+            self.line = self._lineTemplate(dims).format
+
+    def writeBatch(self, batch, answers):
+        '''
+            Записать ответы для порции точек (после writeHeader).
+            Аргументы:
+                batch   - список кортежей координат в порядке вывода
+                answers - словарь {точка: (радиус, число_соседей)}
+        '''
+        if self.fmt in self.LINES:
+            line = self.line
+            text = "".join([line(point, *answers[point]) + "\n" for point in batch])
+            self.stream.write(text.encode())
+        else:
+            values = array("d")
+            for point in batch:
+                values.extend(point)
+                values.extend(answers[point])
+            if sys.byteorder != "little":
+                values.byteswap()
+            self.stream.write(values.tobytes())
+
+    def _lineTemplate(self, dims):
+        '''
+            Вернуть шаблон строки текстового формата для точек
+            с dims координатами. Аргументы:
+                dims - число координат точки
+        '''
+        coords = ""
+        if self.fmt in self.COORDS:
+            separator = ", " if self.fmt == "jsonl" else ","
+            coords = separator.join([self.COORDS[self.fmt].format(index=index, name=name)
+                                     for index, name in enumerate(_columnNames(dims))])
+        return self.LINES[self.fmt].format(coords=coords)
+
+def _columnNames(dims):
+    '''
+        Вернуть список имён координат точки для вывода: x, y, z
+        при dims <= 3, иначе x1, ..., xd. Аргументы:
+            dims - число координат
+    '''
+    if dims <= 3:
+        return list("xyz"[:dims])
+    return ["x{}".format(index+1) for index in range(dims)]
+
+# Форматы входных файлов: имя формата - расширения файлов
+FORMATS = {"text": (), "binary": (".f64", ".bin"), "npy": (".npy",)}
+READ_BATCH = 1 << 16 # число точек в порции при чтении файла
+
+def parse_file(file, fmt="auto", ordered=False):
     '''
         Прочитать файл и вернуть список точек, в нём указанных.
         Если в процессе чтения произошли ошибки, напечатать
-        сообщения об ошибках и вернуть None.
+        сообщения об ошибках и вернуть None. Аргументы:
+            file    - путь к файлу
+            fmt     - формат файла (см. FORMATS):
+                      text   - по точке на строке, координаты через пробел
+                      binary - пары чисел float64 (little-endian) подряд
+                      npy    - массив NumPy формы (N,d) типа float64
+                      auto   - определить формат по расширению файла
+            ordered - вернуть точки упорядоченными по координатам
+                      (как при выводе), а не в порядке файла
     '''
-    with open(file, "r") as f:
-        lines = f.readlines()
+    res = []
     try:
-        res = [tuple(float(x) for x in line.split()) for line in lines if line.strip()]
-    except ValueError:
-        return print("Error: invalid file format")
-    if any(len(pair) != 2 for pair in res):
-        return print("Error: expected 2 digits on a line")
+        for batch in read_batches(file, fmt):
+            res.extend(batch)
+    except ValueError as e:
+        return print("Error: {}".format(e))
     if len(res) < 2:
         return print("Error: at least 2 points expected")
-    if len(set(res)) != len(res):
+    if _has_duplicates(res, ordered):
         return print("Error: duplicate points are not supported")
     return res
 
+def _has_duplicates(points, inplace=False):
+    '''
+        Вернуть True, если в списке есть совпадающие точки: после
+        сортировки они оказываются рядом, и отдельное множество
+        всех точек не нужно. Аргументы:
+            points  - список кортежей координат
+            inplace - упорядочить сам список, а не его копию
+    '''
+    if inplace:
+        points.sort()
+    elif np is not None:
+        # Упорядочиваем массив координат, а не кортежи
+        values = np.array(points)
+        values = values[np.lexsort(values.T[::-1])]
+        return bool((values[1:] == values[:-1]).all(axis=1).any())
+    else:
+        points = sorted(points)
+    return any(map(eq, points, islice(points, 1, None)))
+
+def read_batches(file, fmt="auto"):
+    '''
+        Читать файл порциями, не загружая его в память целиком,
+        и возвращать (генератор) списки не более чем из READ_BATCH
+        точек. При ошибке формата возбуждается ValueError.
+        Аргументы:
+            file - путь к файлу
+            fmt  - формат файла (см. parse_file)
+    '''
+    fmt = _resolve_format(file, fmt)
+    if fmt == "text":
+        return _text_batches(file)
+    return _binary_batches(file, npy=(fmt == "npy"))
+
+def _resolve_format(file, fmt):
+    '''
+        Вернуть формат файла: fmt, либо, если fmt равен "auto",
+        формат, определённый по расширению файла.
+    '''
+    if fmt != "auto":
+        return fmt
+    return next((name for name, exts in FORMATS.items()
+                 if file.lower().endswith(exts)), "text")
+
+def input_key(file, fmt):
+    '''
+        Вернуть 32-байтный ключ (SHA-256) содержимого входного
+        файла и его формата. По ключу находится файл индекса.
+        Аргументы:
+            file - путь к файлу
+            fmt  - формат файла
+    '''
+    digest = hashlib.sha256(_resolve_format(file, fmt).encode() + b"\0")
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def default_cache_dir():
+    '''
+        Вернуть каталог для автоматически сохраняемых файлов индекса.
+    '''
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "headhunter-task1")
+
+def load_indexed_tree(file, fmt, index):
+    '''
+        Вернуть кортеж (ArrayKdTree, список точек) для входного файла,
+        используя файл индекса. Если индекс есть и построен для
+        текущего содержимого файла, он открывается без разбора
+        файла и построения дерева; иначе дерево строится и индекс
+        сохраняется. Если файл содержит ошибки, вернуть None.
+        Аргументы:
+            file  - путь к входному файлу
+            fmt   - формат входного файла
+            index - путь к файлу индекса или каталог, в котором
+                    индекс ищется по ключу содержимого
+    '''
+    key = input_key(file, fmt)
+    if os.path.isdir(index):
+        index = os.path.join(index, key.hex() + ".kdt")
+    loaded = ArrayKdTree.load(index, key)
+    if loaded is not None:
+        return loaded
+    points = parse_file(file, fmt)
+    if not points:
+        return None
+    if len(points[0]) != 2:
+        return print("Error: the array engine supports only 2-dimensional points")
+    tree = ArrayKdTree.fromPoints(points)
+    try:
+        tree.save(index, points, key)
+    except OSError as e:
+        print("Warning: cannot save index file: {}".format(e), file=sys.stderr)
+    return tree, points
+
+def _text_batches(file):
+    '''
+        Читать текстовый файл построчно и возвращать порции
+        точек. Число координат задаётся первой точкой файла.
+    '''
+    batch = []
+    dims = None # число координат, заданное первой точкой
+    error = None
+    with open(file, "r") as f:
+        try:
+            for line in f:
+                pair = line.split()
+                if pair and len(pair) == dims:
+                    batch.append(tuple(map(float, pair)))
+                    if len(batch) == READ_BATCH:
+                        yield batch
+                        batch = []
+                elif pair and dims is None:
+                    dims = len(pair)
+                    batch.append(tuple(map(float, pair)))
+                elif pair:
+                    [float(x) for x in pair] # сначала проверяем формат чисел
+                    error = "expected {} digits on a line".format(dims)
+                    break
+        except (ValueError, UnicodeDecodeError):
+            error = "invalid file format"
+    if error is not None:
+        raise ValueError(error)
+    if batch:
+        yield batch
+
+def _binary_batches(file, npy):
+    '''
+        Читать двоичный файл с координатами в формате float64
+        и возвращать порции точек. Файл отображается в память,
+        и точки строятся прямо из отображения без промежуточных
+        копий. Аргументы:
+            file - путь к файлу
+            npy  - True для формата .npy (массив формы (N,d)),
+                   False для пар float64
+    '''
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset, fortran, dims = 0, False, 2
+            if npy:
+                header = _npy_header(data)
+                if header is None:
+                    raise ValueError("invalid file format")
+                offset, fortran, dims = header
+            if (len(data) - offset) % (8*dims):
+                raise ValueError("invalid file format")
+            view = memoryview(data)[offset:].cast("d")
+            count = len(view)//dims
+            try:
+                for start in range(0, count, READ_BATCH):
+                    stop = min(start + READ_BATCH, count)
+                    if fortran: # сначала все x, затем все y и т. д.
+                        columns = [view[coord*count+start:coord*count+stop]
+                                   for coord in range(dims)]
+                    else:
+                        chunk = view[start*dims:stop*dims]
+                        columns = [chunk[coord::dims] for coord in range(dims)]
+                        del chunk
+                    if sys.byteorder != "little":
+                        columns = [array("d", column) for column in columns]
+                        for column in columns:
+                            column.byteswap()
+                    batch = list(zip(*columns))
+                    # Срезы должны быть освобождены до закрытия отображения
+                    del columns
+                    yield batch
+            finally:
+                view.release()
+
+def _npy_header(data):
+    '''
+        Разобрать заголовок файла .npy. Вернуть кортеж (смещение
+        данных, признак порядка Fortran, число координат d) либо
+        None, если файл не содержит массив float64 формы (N,d).
+        Аргументы:
+            data - содержимое файла
+    '''
+    if len(data) < 12 or data[:6] != b"\x93NUMPY":
+        return None
+    if data[6] == 1:
+        size, start = struct.unpack("<H", data[8:10])[0], 10
+    else:
+        size, start = struct.unpack("<I", data[8:12])[0], 12
+    try:
+        header = ast.literal_eval(data[start:start+size].decode("latin1"))
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(header, dict) or header.get("descr") != "<f8" or \
+            len(header.get("shape", ())) != 2 or header["shape"][1] < 1:
+        return None
+    return start + size, bool(header.get("fortran_order")), header["shape"][1]
+
+def _npy_header_bytes(shape):
+    '''
+        Вернуть заголовок файла .npy (версии 1.0) для массива
+        float64 заданной формы. Аргументы:
+            shape - кортеж размеров массива
+    '''
+    header = "{{'descr': '<f8', 'fortran_order': False, 'shape': {}, }}".format(shape)
+    # Данные должны начинаться с границы 64 байт
+    header += " " * (-(len(header) + 11) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+# Доступные реализации структуры данных
+ENGINES = {"tree": KdTree, "array": ArrayKdTree, "grid": GridIndex}
+
 def main():
     # Точка входа программы
     parser = argparse.ArgumentParser()
     parser.add_argument("file", help="file with list of points", type=str)
+    parser.add_argument("--engine", help="data structure to use (default: tree)",
+        choices=sorted(ENGINES), default="tree")
+    parser.add_argument("--workers", help="number of worker processes (default: 1)",
+        type=int, default=1)
+    parser.add_argument("--format", help="input file format (default: by extension)",
+        choices=["auto"] + sorted(FORMATS), default="auto")
+    parser.add_argument("--output", help="output file (default: standard output)",
+        type=str, default="-")
+    parser.add_argument("--output-format", help="output format (default: text)",
+        choices=ResultWriter.FORMATS, default="text")
+    parser.add_argument("--index", help="index file to load the tree from or save it to "
+        "(requires --engine array)", type=str, default=None)
+    parser.add_argument("--cache", help="keep index files in the cache directory "
+        "(requires --engine array)", action="store_true")
+    parser.add_argument("--cache-dir", help="cache directory (default: {})".format(
+        default_cache_dir()), type=str, default=None)
+    parser.add_argument("--order", help="output order: sorted by coordinates "
+        "(default) or as in the input file", choices=["sorted", "input"], default="sorted")
+    parser.add_argument("--stats", help="write timings, tree depth and search counters "
+        "as JSON to standard error", action="store_true")
+    parser.add_argument("--stats-file", help="write the --stats JSON to this file "
+        "instead (implies --stats)", type=str, default=None)
+    parser.add_argument("--k", help="radius is the distance to the k-th nearest point "
+        "(default: 1, requires --engine tree)", type=int, default=1)
+    parser.add_argument("--multiplier", help="neighbors lie within this many radii "
+        "(default: 2, requires --engine tree)", type=float, default=2)
+    parser.add_argument("--epsilon", help="allowed relative error of radii and neighbor "
+        "circles (default: 0 - exact answers, requires --engine tree)", type=float, default=0)
+    parser.add_argument("--tile-size", help="process the file in tiles of about this many "
+        "points without loading it into memory (requires --engine tree)", type=int, default=None)
+    parser.add_argument("--tile-dir", help="directory for tile files (default: temporary "
+        "directory)", type=str, default=None)
     args = parser.parse_args()
-    points = parse_file(args.file)
-    if not points:
-        return
-    random.seed("TrFtqH1MGAEZigu5") # для воспроизводимости
-    random.shuffle(points) # чтобы иметь статистически сбалансированное дерево
-    tree = KdTree()
-    for point in points:
-        tree.addPoint(point)
-    for point in sorted(points):
-        print("{}: radius {}, neighbors {}".format(point, *tree.getRadiusAndNeighbors(point)))
+    # Далее args.stats - путь к файлу статистики, "-" или None
+    args.stats = args.stats_file or ("-" if args.stats else None)
+    if args.workers < 1:
+        return print("Error: number of workers must be positive")
+    if args.k < 1:
+        return print("Error: k must be positive")
+    if args.multiplier < 1:
+        return print("Error: multiplier must be at least 1")
+    if (args.k, args.multiplier) != (1, 2) and args.engine != "tree":
+        return print("Error: --k and --multiplier require the tree engine")
+    if not args.epsilon >= 0:
+        return print("Error: epsilon must be non-negative")
+    if args.epsilon and args.engine != "tree":
+        return print("Error: --epsilon requires the tree engine")
+    if args.tile_size is not None:
+        if args.tile_size < 1:
+            return print("Error: tile size must be positive")
+        if args.engine != "tree" or args.epsilon or args.index or args.cache or args.cache_dir:
+            return print("Error: --tile-size requires the exact tree engine without index files")
+        return solve_tiled(args)
+    if args.engine == "grid" and np is None:
+        return print("Error: the grid engine requires NumPy")
+    if args.cache or args.cache_dir:
+        args.index = args.cache_dir or default_cache_dir()
+        os.makedirs(args.index, exist_ok=True)
+    timings = {}
+    start = time.perf_counter()
+    if args.index is not None:
+        if args.engine != "array":
+            return print("Error: index files require the array engine")
+        loaded = load_indexed_tree(args.file, args.format, args.index)
+        if loaded is None:
+            return
+        tree, points = loaded
+        timings["load"] = time.perf_counter() - start
+    else:
+        # Для вывода по координатам точки упорядочиваются сразу
+        # при проверке на совпадения
+        points = parse_file(args.file, args.format, args.order == "sorted")
+        if not points:
+            return
+        if len(points[0]) != 2 and args.engine != "tree":
+            return print("Error: the {} engine supports only 2-dimensional points".format(args.engine))
+        if len(points) <= args.k:
+            return print("Error: at least {} points expected".format(args.k + 1))
+        timings["parse"] = time.perf_counter() - start
+        start = time.perf_counter()
+        engine = ENGINES[args.engine]
+        if args.stats is not None and engine is KdTree:
+            engine = ProfiledKdTree
+        if engine in (KdTree, ProfiledKdTree):
+            tree = engine.fromPoints(points, args.k, args.multiplier, args.epsilon)
+        else:
+            tree = engine.fromPoints(points)
+        timings["build"] = time.perf_counter() - start
+    start = time.perf_counter()
+    answers = parallel_answers(tree, args.workers)
+    timings["query"] = time.perf_counter() - start
+    start = time.perf_counter()
+    if args.order == "sorted":
+        points.sort()
+    if args.output == "-":
+        sys.stdout.flush()
+        ResultWriter(sys.stdout.buffer, args.output_format).writeAll(points, answers)
+    else:
+        with open(args.output, "wb") as f:
+            ResultWriter(f, args.output_format).writeAll(points, answers)
+    timings["output"] = time.perf_counter() - start
+    if args.epsilon:
+        sys.stderr.write("Approximation: radii at most {:.6g} times exact, neighbors counted "
+            "within {:.6g} times the neighbor circle\n".format(tree.radiusBound, tree.countBound))
+    if args.stats is not None:
+        write_stats(args.stats, args.engine, tree, len(points), timings)
+
+def solve_tiled(args):
+    '''
+        Решить задачу по плиткам (см. TiledSolver) и вывести
+        ответы так же, как main. Аргументы:
+            args - разобранные аргументы командной строки
+    '''
+    timings = {}
+    with tempfile.TemporaryDirectory(dir=args.tile_dir) as directory:
+        solver = TiledSolver(directory, args.tile_size, args.k, args.multiplier, args.order)
+        try:
+            start = time.perf_counter()
+            solver.partition(args.file, args.format)
+            timings["partition"] = time.perf_counter() - start
+            start = time.perf_counter()
+            solver.solve(args.workers)
+            timings["query"] = time.perf_counter() - start
+        except ValueError as e:
+            return print("Error: {}".format(e))
+        start = time.perf_counter()
+        if args.output == "-":
+            sys.stdout.flush()
+            solver.writeResults(ResultWriter(sys.stdout.buffer, args.output_format))
+        else:
+            with open(args.output, "wb") as f:
+                solver.writeResults(ResultWriter(f, args.output_format))
+        timings["output"] = time.perf_counter() - start
+    if args.stats is not None:
+        write_stats(args.stats, "tiled", solver, solver.count, timings)
+
+def write_stats(file, engine, tree, size, timings):
+    '''
+        Сохранить в JSON сведения о работе программы: время
+        этапов, глубину дерева, достигнутую погрешность
+        приближённого режима и, для ProfiledKdTree, счётчики
+        поисковых операций. Аргументы:
+            file    - путь к файлу или "-" (стандартный поток ошибок)
+            engine  - имя реализации структуры данных
+            tree    - построенное дерево
+            size    - число точек
+            timings - словарь {этап: время в секундах}
+    '''
+    stats = {
+        "engine": engine,
+        "points": size,
+        "depth": tree.depth() if hasattr(tree, "depth") else None,
+        "timings": timings,
+    }
+    if isinstance(tree, KdTree) and tree.epsilon:
+        stats["approximation"] = {
+            "epsilon": tree.epsilon,
+            "radius_bound": tree.radiusBound,
+            "count_bound": tree.countBound,
+        }
+    if isinstance(tree, ProfiledKdTree):
+        stats["searches"] = tree.stats.summary()
+    if isinstance(tree, TiledSolver):
+        stats["tiles"] = tree.stats
+    text = json.dumps(stats, indent=2) + "\n"
+    if file == "-":
+        sys.stderr.write(text)
+    else:
+        with open(file, "w") as f:
+            f.write(text)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,10 +7,12 @@
     количество способов представить число n в виде суммы k
     натуральных слагаемых, если способы, отличающиеся только
     порядком слагаемых, считать одинаковыми. n <= 150, k <= 150
+    (программа работает и для n порядка десятков тысяч).
 
     ФОРМАТ ВХОДНЫХ ДАННЫХ:
     Программа получает на вход два целочисленных аргумента - числа
-    n и k.
+    n и k. Необязательный ключ --modulus m задаёт модуль, по
+    которому вычисляется ответ.
 
     ФОРМАТ ВЫХОДНЫХ ДАННЫХ:
     В стандартный вывод печатается целое число, являющееся ответом.
@@ -18,34 +20,242 @@
     Описание алгоритма решения приведено в README.
 '''
 
-import argparse
+import os, sys, struct, tempfile, argparse
+from array import array
+from operator import add
 
-def num_fragments(n, k, cache=None):
+# Через сколько добавленных слагаемых строка приводится по модулю:
+# приведение после каждого стоит столько же, сколько само сложение
+REDUCE_EVERY = 16
+
+# Число ответов, записываемых в пакетном режиме за одну операцию
+BATCH_LINES = 1 << 16
+
+def num_fragments(n, k, modulus=None):
+    '''
+        Вернуть число разбиений числа n на k слагаемых (по модулю
+        modulus, если он задан). Вычитая единицу из каждого
+        слагаемого, получаем разбиения числа n-k на слагаемые,
+        не превосходящие k. Их число считается по одной строке
+        длины n-k+1, в которую по очереди добавляются слагаемые
+        1, 2, ..., k, поэтому память составляет O(n), а время -
+        O((n-k)*min(k, n-k)). Аргументы:
+            n       - целое число
+            k       - целое число
+            modulus - натуральный модуль или None
+    '''
+    if n == k:
+        count = 1
+    elif k < 1 or k > n:
+        count = 0
+    else:
+        rest = n - k
+        ways = [1] + [0]*rest # ways[m] - число разбиений m на добавленные слагаемые
+        for part in range(1, min(k, rest)+1):
+            _add_part(ways, part)
+            if modulus and part % REDUCE_EVERY == 0:
+                ways[:] = [value % modulus for value in ways]
+        count = ways[rest]
+    return count % modulus if modulus else count
+
+def _add_part(ways, part):
+    '''
+        Разрешить в разбиениях слагаемое part: ways[m] += ways[m-part]
+        для всех m по возрастанию. Строка обрабатывается кусками
+        длины part, каждый из которых складывается с уже обновлённым
+        предыдущим куском за одну операцию над срезами. Аргументы:
+            ways - список чисел разбиений (изменяется на месте)
+            part - добавляемое слагаемое
+    '''
+    for start in range(part, len(ways), part):
+        ways[start:start+part] = map(add, ways[start:start+part], ways[start-part:start])
+
+class PartitionTable:
+    '''
+        Таблица чисел разбиений p(n,k) для всех 0 <= k <= n <= size,
+        заполняемая снизу вверх по формуле
+        p(n,k) = p(n-1,k-1) + p(n-k,k). Таблица хранится
+        треугольником в одном плоском массиве: p(n,k) лежит по
+        индексу n*(n+1)/2 + k, поэтому ответ на запрос - одно
+        обращение к массиву. При заданном модуле, не превосходящем
+        2^64, значения хранятся в array('Q'), иначе - в списке.
+        Таблицу можно сохранить в файл и загрузить из него.
+    '''
+
+    MAGIC = b"P2TABL1" + (b"<" if sys.byteorder == "little" else b">")
+    HEADER = 32 # сигнатура, size, ширина значения и длина модуля в байтах
+
+    def __init__(self, modulus=None):
+        '''
+            modulus - натуральный модуль или None
+        '''
+        self.modulus = modulus
+        self.size = 0 # наибольшее n, для которого заполнена строка
+        first = 1 % modulus if modulus else 1
+        if modulus and modulus <= 1 << 64:
+            self.values = array("Q", [first])
+        else:
+            self.values = [first]
+
+    def get(self, n, k):
+        '''
+            Вернуть p(n,k), при необходимости дополнив таблицу
+            до строки n. Аргументы:
+                n - целое число
+                k - целое число
+        '''
+        if n < 0 or k < 0 or k > n:
+            return 0
+        if n > self.size:
+            self.extend(n)
+        return self.values[n*(n+1)//2 + k]
+
+    def extend(self, size):
+        '''
+            Дополнить таблицу строками до n = size включительно.
+            Аргументы:
+                size - наибольшее n
+        '''
+        values, modulus = self.values, self.modulus
+        for n in range(self.size+1, size+1):
+            previous = (n-1)*n//2
+            values.append(0)
+            for k in range(1, n+1):
+                value = values[previous + k-1]
+                if 2*k <= n:
+                    value += values[(n-k)*(n-k+1)//2 + k]
+                values.append(value % modulus if modulus else value)
+            self.size = n
+
+    def save(self, file):
+        '''
+            Сохранить таблицу в файл. Запись атомарна: файл
+            сначала пишется во временный файл рядом. Аргументы:
+                file - путь к файлу
+        '''
+        if isinstance(self.values, array):
+            width, body = 0, self.values.tobytes()
+        else:
+            # Длинные числа хранятся с одинаковой шириной в байтах
+            width = max(1, (max(self.values).bit_length() + 7) // 8)
+            body = b"".join(value.to_bytes(width, "little") for value in self.values)
+        modulus = self.modulus or 0
+        modulus = modulus.to_bytes((modulus.bit_length() + 7) // 8, "little")
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.MAGIC + struct.pack("<QQQ", self.size, width, len(modulus)))
+                f.write(modulus)
+                f.write(body)
+            # Права обычного нового файла вместо 0600 от mkstemp
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp, 0o666 & ~umask)
+            os.replace(temp, file)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    @classmethod
+    def load(cls, file):
+        '''
+            Загрузить таблицу, сохранённую методом save. Вернуть
+            объект PartitionTable либо None, если файла нет или
+            он повреждён. Аргументы:
+                file - путь к файлу
+        '''
+        try:
+            with open(file, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < cls.HEADER or data[:8] != cls.MAGIC:
+            return None
+        size, width, length = struct.unpack("<QQQ", data[8:cls.HEADER])
+        modulus = int.from_bytes(data[cls.HEADER:cls.HEADER+length], "little")
+        table = cls(modulus or None)
+        count = (size+1)*(size+2)//2
+        body = memoryview(data)[cls.HEADER+length:]
+        if isinstance(table.values, array) != (width == 0) or \
+                len(body) != count*(width or table.values.itemsize):
+            return None
+        if width == 0:
+            table.values = array("Q")
+            table.values.frombytes(body)
+        else:
+            table.values = [int.from_bytes(body[i:i+width], "little")
+                            for i in range(0, len(body), width)]
+        table.size = size
+        return table
+
+def answer_batch(lines, output, table):
     '''
-        Вернуть число разбиений числа n на k слагаемых. Аргументы:
-            n - целое число
-            k - целое число
-            cache - словарь, ключи в котором - пары (n,k),
-                    значения - вычисленные зачения функции
-                    с этими параметрами
+        Ответить на запросы, по одному на строке "n k", записывая
+        ответы по одному на строке. Вернуть False, если в строке
+        ошибка (сообщение о ней выводится после ответов на
+        предыдущие строки). Аргументы:
+            lines  - итерируемый объект со строками запросов
+            output - поток для записи ответов
+            table  - объект PartitionTable
     '''
-    if n == k or k == 1:
-        return 1
-    if k > n:
-        return 0
-    if cache is None:
-        cache = {}
-    if (n,k) in cache:
-        return cache[(n,k)]
-    cache[(n,k)] = num_fragments(n-1, k-1, cache) + num_fragments(n-k, k, cache)
-    return cache[(n,k)]
+    answers = []
+    for number, line in enumerate(lines, 1):
+        pair = line.split()
+        if not pair:
+            continue
+        try:
+            n, k = map(int, pair)
+        except ValueError:
+            output.write("".join(answers))
+            output.write("Error: expected 2 integers on line {}\n".format(number))
+            return False
+        answers.append("{}\n".format(table.get(n, k)))
+        if len(answers) >= BATCH_LINES:
+            output.write("".join(answers))
+            answers = []
+    output.write("".join(answers))
+    return True
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("n", help="the number to split", type=int)
-    parser.add_argument("k", help="number of split fragments", type=int)
+    parser.add_argument("n", help="the number to split", type=int, nargs="?")
+    parser.add_argument("k", help="number of split fragments", type=int, nargs="?")
+    parser.add_argument("--modulus", help="print the answer modulo this number",
+        type=int, default=None)
+    parser.add_argument("--batch", help="answer pairs 'n k' read from a file, "
+        "one per line ('-' for standard input)", type=str, default=None)
+    parser.add_argument("--table", help="file to load the precomputed table from; "
+        "the table is saved there if it is missing or was extended", type=str, default=None)
     args = parser.parse_args()
-    print(num_fragments(args.n, args.k))
+    if args.modulus is not None and args.modulus < 1:
+        return print("Error: modulus must be positive")
+    if (args.batch is None) == (args.n is None or args.k is None) or \
+            args.batch is not None and args.n is not None:
+        return print("Error: expected either n and k or --batch")
+    if args.table is None and args.batch is None:
+        return print(num_fragments(args.n, args.k, args.modulus))
+    table = None
+    if args.table is not None and os.path.exists(args.table):
+        table = PartitionTable.load(args.table)
+        if table is None:
+            return print("Error: invalid table file")
+        if table.modulus != args.modulus:
+            return print("Error: table file was computed with modulus {}".format(table.modulus))
+    if table is None:
+        table = PartitionTable(args.modulus)
+    size = table.size
+    if args.batch is None:
+        print(table.get(args.n, args.k))
+    elif args.batch == "-":
+        ok = answer_batch(sys.stdin, sys.stdout, table)
+    else:
+        with open(args.batch) as f:
+            ok = answer_batch(f, sys.stdout, table)
+    if args.batch is not None and not ok:
+        # Таблица не сохраняется: ошибка во входных данных
+        sys.exit(1)
+    if args.table is not None and (table.size > size or not os.path.exists(args.table)):
+        table.save(args.table)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,101 +5,303 @@
     Результат, полученный через структуру данных
     Kd-Tree проверяется наивной реализацией
     решения поставленной задачи.
+
+    Аргументы k и multiplier всех функций обобщают задачу так
+    же, как в task1: радиус - расстояние до k-й ближайшей точки,
+    соседи - остальные точки в пределах радиуса, умноженного
+    на multiplier.
 '''
 
-import math, random, argparse
-from task1 import KdTree, parse_file
+import os, math, random, tempfile, argparse
+from task1 import KdTree, IncrementalKdTree, TiledSolver, ENGINES, parse_file
+
+try:
+    import numpy as np
+except ImportError: # без NumPy используется наивная реализация
+    np = None
 
-def radius_and_neighbors_tree(points):
+# Проверяемые реализации: все движки task1, IncrementalKdTree
+# и обработка по плиткам
+TESTED = dict(ENGINES, incremental=IncrementalKdTree, tiled=TiledSolver)
+
+def radius_and_neighbors_tree(points, engine=KdTree, k=1, multiplier=2):
     '''
         Найти радиус и число соседей каждой точки из
         списка с помощью структуры данных Kd-Tree.
         Вернуть словарь, в котором ключи - точки,
         а значения - кортежи (радиус, число_соседей).
         Аргументы:
-            points - список кортежей (x,y)
+            points - список кортежей координат
+            engine - класс реализации Kd-Tree
     '''
-    random.seed("TrFtqH1MGAEZigu5") # для воспроизводимости
-    random.shuffle(points) # чтобы иметь статистически сбалансированное дерево
-    tree = KdTree()
-    for point in points:
+    if engine is IncrementalKdTree:
+        return radius_and_neighbors_incremental(points, k, multiplier)
+    if engine is TiledSolver:
+        return radius_and_neighbors_tiled(points, k, multiplier)
+    if issubclass(engine, KdTree):
+        return engine.fromPoints(points, k, multiplier).allRadiiAndNeighbors()
+    return engine.fromPoints(points).allRadiiAndNeighbors()
+
+def radius_and_neighbors_incremental(points, k=1, multiplier=2):
+    '''
+        Найти радиус и число соседей каждой точки из
+        списка с помощью IncrementalKdTree: дерево строится
+        по половине точек, остальные точки добавляются по
+        одной, затем четверть точек удаляется и добавляется
+        снова. Повторная вставка имеющейся точки отклоняется
+        и не должна менять ответы. Вернуть словарь в том же
+        формате, что и radius_and_neighbors_tree. Аргументы:
+            points - список кортежей координат
+    '''
+    half = len(points)//2
+    tree = IncrementalKdTree.fromPoints(points[:half], k, multiplier)
+    for point in points[half:]:
         tree.addPoint(point)
-    return {point: tree.getRadiusAndNeighbors(point) for point in points}
+    for point in points[:1]:
+        try:
+            tree.addPoint(point)
+        except ValueError:
+            pass
+    removed = random.Random(len(points)).sample(points, len(points)//4)
+    for point in removed:
+        tree.removePoint(point)
+    for point in removed:
+        tree.addPoint(point)
+    return tree.allRadiiAndNeighbors()
+
+def radius_and_neighbors_tiled(points, k=1, multiplier=2):
+    '''
+        Найти радиус и число соседей каждой точки из списка
+        обработкой по плиткам (TiledSolver). Плитки выбираются
+        маленькими (около 1/8 точек), чтобы у многих точек круг
+        соседей выходил за полосу и проверялся второй проход.
+        Вернуть словарь в том же формате, что и
+        radius_and_neighbors_tree. Аргументы:
+            points - список кортежей координат
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "points.txt")
+        with open(path, "w") as f:
+            f.write("".join(" ".join(map(repr, point)) + "\n" for point in points))
+        solver = TiledSolver(directory, max(1, len(points)//8), k, multiplier)
+        solver.partition(path)
+        solver.solve()
+        return dict(solver.iterAnswers())
 
 def distance_to(p1, p2):
     '''
         Вернуть расстояние между точками. Аргументы:
-            p1, p2 - кортежи значений (x,y)
+            p1, p2 - кортежи координат
     '''
-    return math.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
+    square = 0.0
+    for a, b in zip(p1, p2):
+        square += (a-b)*(a-b)
+    return math.sqrt(square)
 
-def radius_and_neighbors_naive(points):
+def radius_and_neighbors_naive(points, k=1, multiplier=2):
     '''
         Найти радиус и число соседей каждой точки из
         списка. Наивная реализация, сложность O(n^2).
         Вернуть словарь, в котором ключи - точки,
         а значения - кортежи (радиус, число_соседей).
         Аргументы:
-            points - список кортежей (x,y)
+            points - список кортежей координат
     '''
     result = {}
     for point in points:
-        radius = None
-        for other in points:
-            dist = distance_to(point, other)
-            if dist != 0 and (radius is None or radius > dist):
-                radius = dist
-        neighbors = 0
-        for other in points:
-            dist = distance_to(point, other)
-            if radius <= dist <= 2*radius:
-                neighbors += 1
+        dists = [distance_to(point, other) for other in points]
+        others = sorted(dist for dist in dists if dist != 0)
+        radius = others[k-1] if len(others) >= k else math.inf
+        neighbors = sum(1 for dist in dists if 0 < dist <= multiplier*radius)
         result[point] = (radius, neighbors)
     return result
 
-def mismatches(points):
+# Максимальное число расстояний, вычисляемых за один шаг
+ORACLE_BLOCK = 1 << 16
+
+def radius_and_neighbors_numpy(points, k=1, multiplier=2, block=ORACLE_BLOCK):
+    '''
+        Найти радиус и число соседей каждой точки из
+        списка перебором всех пар средствами NumPy.
+        Расстояния вычисляются блоками строк не более
+        чем по block значений, так что объём памяти не
+        зависит квадратично от числа точек. Результат
+        совпадает с radius_and_neighbors_naive.
+        Аргументы:
+            points - список кортежей координат
+            block  - число расстояний в одном блоке
+    '''
+    columns = np.array(points, dtype=np.float64).T.copy()
+    rows = max(1, block // len(points))
+    result = {}
+    for start in range(0, len(points), rows):
+        squares = np.zeros((min(rows, len(points)-start), len(points)))
+        for column in columns:
+            diff = column[start:start+rows,None] - column
+            diff *= diff
+            squares += diff
+        # Нулевое расстояние от точки до самой себя не учитываем
+        diagonal = np.arange(len(squares))
+        squares[diagonal, start + diagonal] = np.inf
+        if k == 1:
+            radii = np.sqrt(squares.min(axis=1))
+        elif k < len(points):
+            radii = np.sqrt(np.partition(squares, k-1, axis=1)[:,k-1])
+        else:
+            radii = np.full(len(squares), np.inf)
+        # Соседи - это точки, для которых sqrt(квадрат) <= multiplier*радиус;
+        # при бесконечном радиусе в их число попадает и сама точка
+        limits = _square_limits(multiplier*radii)
+        neighbors = np.count_nonzero(squares <= limits[:,None], axis=1) - np.isinf(limits)
+        for point, radius, count in zip(points[start:start+rows],
+                                        radii.tolist(), neighbors.tolist()):
+            result[point] = (radius, count)
+    return result
+
+def _square_limits(bounds):
+    '''
+        Для каждого значения d из массива bounds найти наибольшее
+        число t с плавающей точкой, для которого np.sqrt(t) <= d,
+        чтобы сравнивать с d квадраты расстояний без извлечения
+        корня и с тем же результатом. Аргументы:
+            bounds - массив неотрицательных значений
+    '''
+    limits = bounds*bounds
+    while True:
+        over = np.sqrt(limits) > bounds
+        if not over.any():
+            break
+        limits = np.where(over, np.nextafter(limits, 0), limits)
+    while True:
+        larger = np.nextafter(limits, np.inf)
+        fits = (np.sqrt(larger) <= bounds) & (larger > limits)
+        if not fits.any():
+            break
+        limits = np.where(fits, larger, limits)
+    return limits
+
+def radius_and_neighbors_oracle(points, k=1, multiplier=2):
+    '''
+        Найти радиус и число соседей каждой точки из списка
+        перебором: средствами NumPy, если он установлен,
+        иначе наивной реализацией. Аргументы:
+            points - список кортежей координат
+    '''
+    if np is None:
+        return radius_and_neighbors_naive(points, k, multiplier)
+    return radius_and_neighbors_numpy(points, k, multiplier)
+
+def mismatches(points, engine=KdTree, expected=None, k=1, multiplier=2):
     '''
         Сопоставить результаты, поулчаемые на данном наборе
-        точек методом KdTree и наивным методом. При
+        точек методом KdTree и перебором. При
         возникновении несоответствий записать их в
         словарь в формате
             {точка: ((радиус1, соседи1),(радиус2, соседи2))}
         и вернуть этот словарь. Аргументы:
-            points - список кортежей (x,y)
+            points   - список кортежей координат
+            engine   - класс реализации Kd-Tree
+            expected - результат radius_and_neighbors_oracle
+                       для points, если уже вычислен
     '''
     errs = {}
-    res1 = radius_and_neighbors_naive(points)
-    res2 = radius_and_neighbors_tree(points)
+    if expected is None:
+        expected = radius_and_neighbors_oracle(points, k, multiplier)
+    res1 = expected
+    res2 = radius_and_neighbors_tree(points, engine, k, multiplier)
     for point in points:
         if res1[point] != res2[point]:
             errs[point] = (res1[point], res2[point])
     return errs
 
-def minimum_error_set(points):
+def minimum_error_set(points, engine=KdTree, expected=None, k=1, multiplier=2):
+    '''
+        Вернуть короткий список точек, в котором
+        наблюдаются несоответствия между результатами
+        метода KdTree и перебора. Сначала проверяются
+        окрестности точек с несоответствиями: ответ
+        перебора для точки зависит только от точек в
+        пределах её круга соседей. Затем список
+        сокращается алгоритмом ddmin (delta debugging):
+        удаляются куски списка, пока несоответствие
+        сохраняется. Аргументы:
+            points   - список кортежей координат
+            engine   - класс реализации Kd-Tree
+            expected - результат radius_and_neighbors_oracle
+                       для points, если уже вычислен
     '''
-        Вернуть минимальной длины список точек,
-        в котором наблюдаются несоответствия между
-        результатами метода KdTree и наивного
-        метода.
+    if expected is None:
+        expected = radius_and_neighbors_oracle(points, k, multiplier)
+    checked = {}
+    def fails(subset):
+        # Результаты проверок запоминаются: ddmin повторяет подмножества
+        key = frozenset(subset)
+        if key not in checked:
+            checked[key] = len(subset) > k and bool(
+                mismatches(subset, engine, None, k, multiplier))
+        return checked[key]
+    errs = mismatches(points, engine, expected, k, multiplier)
+    for point in sorted(errs, key=lambda p: expected[p][0]):
+        radius = expected[point][0]
+        local = [p for p in points if distance_to(p, point) <= multiplier*radius]
+        if fails(local):
+            points = local
+            break
+    return ddmin(points, fails)
+
+def ddmin(points, fails):
+    '''
+        Сократить список точек алгоритмом ddmin: разбить
+        его на n кусков и оставить кусок или дополнение к
+        куску, на котором ошибка сохраняется; если таких
+        нет - разбить мельче. Вернуть список, из которого
+        нельзя удалить ни одной точки без потери ошибки.
+        Аргументы:
+            points - список кортежей координат, на котором fails истинна
+            fails  - функция, проверяющая наличие ошибки на списке
     '''
-    while mismatches(points):
-        last = list(points)
-        points.remove(random.choice(points))
-    return last
+    n = 2
+    while len(points) >= 2:
+        size = len(points)
+        chunks = [points[size*i//n:size*(i+1)//n] for i in range(n)]
+        for i, chunk in enumerate(chunks):
+            if fails(chunk):
+                points, n = chunk, 2
+                break
+            rest = [p for j, other in enumerate(chunks) if j != i for p in other]
+            if n > 2 and fails(rest):
+                points, n = rest, max(n-1, 2)
+                break
+        else:
+            if n >= size:
+                break
+            n = min(2*n, size)
+    return points
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("file", help="file with list of points", type=str)
+    parser.add_argument("--engine", help="data structure to test (default: tree)",
+        choices=sorted(TESTED), default="tree")
+    parser.add_argument("--k", help="radius is the distance to the k-th nearest point "
+        "(default: 1)", type=int, default=1)
+    parser.add_argument("--multiplier", help="neighbors lie within this many radii "
+        "(default: 2)", type=float, default=2)
     args = parser.parse_args()
+    engine = TESTED[args.engine]
+    if (args.k, args.multiplier) != (1, 2) and not (issubclass(engine, KdTree) or
+                                                    engine is TiledSolver):
+        return print("Error: --k and --multiplier require the tree engine")
     points = parse_file(args.file)
     if not points:
         return
-    if len(mismatches(points)) == 0:
+    expected = radius_and_neighbors_oracle(points, args.k, args.multiplier)
+    if len(mismatches(points, engine, expected, args.k, args.multiplier)) == 0:
         print("OK")
     else:
-        errset = minimum_error_set(points)
-        errs = mismatches(errset)
-        txt = "\n".join(["{} {}".format(*p) for p in errset])
+        errset = minimum_error_set(points, engine, expected, args.k, args.multiplier)
+        errs = mismatches(errset, engine, None, args.k, args.multiplier)
+        txt = "\n".join([" ".join(map(str, p)) for p in errset])
         with open("minerr.txt", "w") as f:
             f.write(txt)
         print("ERROR. Minimum error set written to 'minerr.txt'. Length: {}".format(len(errset)))